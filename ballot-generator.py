@@ -3,13 +3,22 @@
 # Experiments in pulling length, height, and speed data for generic RCDB lists
 # Author: Grant Barker
 
+import os
 import re
 import sys
+import json
 import lxml
 import argparse
 import datetime
+from collections import deque
 from bs4 import BeautifulSoup
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from rcdbcache import PoliteFetcher, fetchURL
+except:
+    print('Could not find "rcdbcache.py"; exiting...')
+    sys.exit()
 
 # command line arguments
 parser = argparse.ArgumentParser(description='Pull coaster stats from RCDB list into .csv')
@@ -26,6 +35,12 @@ parser.add_argument("-d", "--skipnodate", action="store_true",
                     help="skip all coasters with nonspecific opening date")
 parser.add_argument("-k", "--skipkiddie", action="store_true",
                     help="skip all kiddie coasters")
+parser.add_argument("-j", "--jobs", type=int, default=4,
+                    help="specify number of RCDB pages to fetch at once")
+parser.add_argument("-r", "--rate", type=float, default=4.0,
+                    help="specify maximum requests per second to RCDB")
+parser.add_argument("-c", "--checkpoint",
+                    help="specify progress file for resuming an interrupted crawl (default: outfile + .checkpoint)")
 parser.add_argument("-v", "--verbose", action="count", default=0,
                     help="print data as it's processed; duplicate for more detail")
 
@@ -33,96 +48,163 @@ args = parser.parse_args()
 
 if args.outfile[-4:] != ".csv":
     args.outfile += ".csv"
+if args.checkpoint is None:
+    args.checkpoint = args.outfile + ".checkpoint"
+
+# paces requests and retries failed ones, however many threads are fetching
+fetcher = PoliteFetcher(fetchURL, args.rate)
 
 this_year = str(datetime.datetime.now().year)
 
+# the crawl is checkpointed as it goes, one JSON line per finished page (with the links
+#   found on each list page), and the .csv is only ever appended to; rerun the same
+#   command after an interruption to pick up where it left off
 def main():
-    coasters = []
-    rcdblink = args.rcdblink
-
-    # counters for while loop
-    i = 0
-    j = len(rcdblink)
+    done = set()    # coaster pages already written (or skipped)
+    list_pages = {} # list page: (coaster pages, next list pages)
+    failed = []     # pages that couldn't be read this time
+
+    resuming = os.path.isfile(args.checkpoint) and os.path.isfile(args.outfile)
+    if resuming:
+        with open(args.checkpoint) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError: # the last line may have been cut off
+                    continue
+                if "coasters" in entry:
+                    list_pages[entry["url"]] = (entry["coasters"], entry["next"])
+                else:
+                    done.add(entry["url"])
+
+        # a coaster might have made it into the .csv just before the crawl was interrupted
+        with open(args.outfile, encoding="utf-8") as f:
+            next(f, None)
+            for line in f:
+                done.add(line.rstrip("\n").rsplit(",", 1)[-1])
+        print("Resuming crawl: {0} list pages and {1} coasters already done.".format(len(list_pages), len(done)))
+
+    with open(args.outfile, "a" if resuming else "w", encoding="utf-8") as file, \
+         open(args.checkpoint, "a" if resuming else "w") as checkpoint, \
+         ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        if not resuming:
+            file.write("Name,Park,Location,Opening Date,Length,Height,Drop,Speed,Inversions,Vertical Angle,Duration,RCDB Link\n")
+
+        # pages are fetched several at a time, but parsed and written in the order they're listed
+        for url, page in fetch_in_order(pool, coaster_urls(done, list_pages, checkpoint, failed), 2 * max(1, args.jobs)):
+            try:
+                c = parse_rcdb_page(url, page.result())
+            except Exception as e: # left out of the checkpoint, so a rerun tries it again
+                print("Could not read " + url + ": " + str(e))
+                failed.append(url)
+                continue
+            if c is not None:
+                file.write(csv_line(c))
+                file.flush()
+            checkpoint.write(json.dumps({"url": url}) + "\n")
+            checkpoint.flush()
+
+    # the crawl is finished; the next run starts over, unless some pages are left to retry
+    if failed:
+        print(str(len(failed)) + " pages could not be read; run again to retry them.")
+    else:
+        os.remove(args.checkpoint)
+
+# every coaster page to scrape, in order, reading through list pages (and any pages
+#   after them) as needed; pages already done are left out
+def coaster_urls(done, list_pages, checkpoint, failed):
+    for rcdblink in args.rcdblink:
+        pending = [rcdblink]
+        while pending:
+            url = pending.pop(0)
+            if args.verbose > 0:
+                print("<<< Now checking " + url + " >>>")
 
-    while i < j:
-        if args.verbose > 0:
-            print("<<< Now checking " + rcdblink[i] + " >>>")
+            # handle pages that are (presumably) individual coasters
+            if not is_list_page(url):
+                if url not in done:
+                    yield url
+                continue
 
-        # handle pages that are lists of coasters
-        if is_list_page(rcdblink[i]):
+            # handle pages that are lists of coasters
             if args.sortbydate:
-                if rcdblink[i][-8:] != "&order=8" and rcdblink[i][-7:-1] != "&page=":
-                    rcdblink[i] += "&order=8"
-
-            response = urlopen(rcdblink[i])
-            html = response.read()
-            soup = BeautifulSoup(html, 'lxml')
-
-            table = soup.find('tbody')
-
-            # iterate over all coasters listed on the page
-            for tr in table.find_all('tr'):
-                td = tr.find_all('td')[1]
-                url = "https://rcdb.com" + td.find('a').get('href')
-
-                # name = td.text
-
-                # if args.skipunknown:
-                #     if name == "unknown":
-                #         continue
-                # park = tr.find_all('td')[2].text
-                # date = tr.find_all('td')[6].text
-
-                # c = {}
-                # c["name"] = "\"" + name + "\""
-                # c["park"] = "\"" + park + "\""
-                # c["date"] = date
-                # c["url"] = url
-
-                c = parse_rcdb_page(url)
-                if c is not None:
-                    coasters.append(c)
-
-            # check if there's another list page to scrape in the footer
-            rfoot = soup.find('div', attrs={'id':'rfoot'})
-            if rfoot is not None:
-                for a in rfoot.find_all('a'):
-                    if a.text == ">>":
-                        rcdblink.insert(i+1, "https://rcdb.com" + a.get('href'))
-
-        # handle pages that are (presumably) individual coasters
+                if url[-8:] != "&order=8" and url[-7:-1] != "&page=":
+                    url += "&order=8"
+            if url not in list_pages:
+                try:
+                    list_pages[url] = read_list_page(url)
+                except Exception as e:
+                    print("Could not read " + url + ": " + str(e))
+                    failed.append(url)
+                    continue
+                coasters, next_pages = list_pages[url]
+                checkpoint.write(json.dumps({"url": url, "coasters": coasters, "next": next_pages}) + "\n")
+                checkpoint.flush()
+            coasters, next_pages = list_pages[url]
+
+            for coaster in coasters:
+                if coaster not in done:
+                    yield coaster
+
+            # the next list page comes before any other pages given with -i
+            pending[:0] = next_pages
+
+# submit pages to pool as they're asked for, with at most window of them outstanding;
+#   yields (url, future page) in the order the urls came in
+def fetch_in_order(pool, urls, window):
+    pending = deque()
+    for url in urls:
+        pending.append((url, pool.submit(fetch_page, url)))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+def fetch_page(url):
+    status, headers, html = fetcher(url, {})
+    if status != 200:
+        raise OSError("HTTP " + str(status))
+    return html
+
+# the coaster pages listed on a list page, and the next list page, if there is one
+def read_list_page(url):
+    soup = BeautifulSoup(fetch_page(url), 'lxml')
+
+    coasters = []
+    table = soup.find('tbody')
+
+    # iterate over all coasters listed on the page
+    for tr in table.find_all('tr'):
+        td = tr.find_all('td')[1]
+        coasters.append("https://rcdb.com" + td.find('a').get('href'))
+
+    # check if there's another list page to scrape in the footer
+    next_pages = []
+    rfoot = soup.find('div', attrs={'id':'rfoot'})
+    if rfoot is not None:
+        for a in rfoot.find_all('a'):
+            if a.text == ">>":
+                next_pages.append("https://rcdb.com" + a.get('href'))
+
+    return coasters, next_pages
+
+def csv_line(c):
+    def none_to_blank(key, c, csvline):
+        if key not in c or c[key] is None:
+            return csvline + ","
         else:
-            c = parse_rcdb_page(rcdblink[i])
-            if c is not None:
-                coasters.append(c)
-
-        # increment while loop counter
-        i += 1
-        j = len(rcdblink)
-
-    # file = open(args.outfile, "w")
-    # file.write("Name,Park,Location,Opening Date,Length,Height,Drop,Speed,Inversions,Vertical Angle,Duration,RCDB Link\n")
-
-    # def none_to_blank(key, c, csvline):
-    #     if key not in c or c[key] is None:
-    #         return csvline + ","
-    #     else:
-    #         return csvline + c[key] + ","
-
-    # for c in coasters:
-    #     csvline = c["name"] + "," + c["park"] + "," + c["location"] + ","
-    #     csvline = none_to_blank("date", c, csvline)
-    #     csvline = none_to_blank("length", c, csvline)
-    #     csvline = none_to_blank("height", c, csvline)
-    #     csvline = none_to_blank("drop", c, csvline)
-    #     csvline = none_to_blank("speed", c, csvline)
-    #     csvline = none_to_blank("inver", c, csvline)
-    #     csvline = none_to_blank("vert", c, csvline)
-    #     csvline = none_to_blank("dur", c, csvline)
-    #     csvline = csvline + c["url"] + "\n"
-    #     file.write(csvline)
-
-    # file.close()
+            return csvline + c[key] + ","
+
+    csvline = c["name"] + "," + c["park"] + "," + c["location"] + ","
+    csvline = none_to_blank("date", c, csvline)
+    csvline = none_to_blank("length", c, csvline)
+    csvline = none_to_blank("height", c, csvline)
+    csvline = none_to_blank("drop", c, csvline)
+    csvline = none_to_blank("speed", c, csvline)
+    csvline = none_to_blank("inver", c, csvline)
+    csvline = none_to_blank("vert", c, csvline)
+    csvline = none_to_blank("dur", c, csvline)
+    return csvline + c["url"] + "\n"
 
 def is_list_page(url):
     substring = url.split("rcdb.com/", 1)[1]
@@ -131,12 +213,10 @@ def is_list_page(url):
     else:
         return False
 
-def parse_rcdb_page(url):
+def parse_rcdb_page(url, chtml):
     c = {}
     c["url"] = url
 
-    cresponse = urlopen(url)
-    chtml = cresponse.read()
     csoup = BeautifulSoup(chtml, 'lxml')
 
     # get name, alt name, park, and location
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: ballot reading and tallying
+#  Author: Grant Barker
+#
+#  Nothing in here touches the command line arguments, so
+#    worker processes can import it safely
+# ==========================================================
+
+import io
+import os
+import hashlib
+import numpy as np
+
+from matrix import WinLossMatrix
+
+# global strings for parsing ballots
+commentStr = "* "
+blankUserField = "-Replace "
+startLine = "! DO NOT CHANGE OR DELETE THIS LINE !"
+
+class Ballot:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.voterInfo = [filename, "", "", "", "", ""]
+        self.creditNum = 0
+
+        # coaster indices in the order they appear on the ballot, and their ranks
+        self.indices = np.zeros(0, dtype=np.intp)
+        self.ranks = np.zeros(0, dtype=np.int32)
+
+        # problems found while reading, printed by whoever reports on the ballot
+        self.messages = []
+        self.error = False
+
+        # where the ballot came from, for noticing when it changes
+        self.path = ""
+        self.size = 0
+        self.mtime = 0
+        self.contentHash = ""
+
+
+
+# ================================================================
+#  read a ballot (just ONE ballot) from its lines of text
+#
+#  coasterIndex maps each full coaster name to its matrix index
+# ================================================================
+
+def readBallot(lines, filename, coasterIndex):
+    ballot = Ballot(filename)
+    coasterAndRank = {}
+
+    infoField = 1
+    lineNum = 0
+    startProcessing = False
+
+    for line in lines:
+        sline = line.strip()
+        lineNum += 1
+
+        # begin at top of ballot and get the voter's info first
+        if startProcessing == False and infoField <= 5 and not commentStr in sline and len(sline) != 0:
+
+            # if the line begins with "-Replace" then record a non-answer
+            if blankUserField in sline:
+                ballot.voterInfo[infoField] = ""
+                infoField += 1
+            elif not startLine in sline:
+                ballot.voterInfo[infoField] = sline.strip('-').strip()
+                infoField += 1
+
+        # skip down the file to the coasters
+        if startProcessing == False and sline == startLine:
+            startProcessing = True
+
+        elif startProcessing == True:
+
+            # break the line into its components: rank, name
+            words = [x.strip() for x in sline.split(',')]
+
+            if commentStr in sline: # skip comment lines (begin with "* ")
+                continue
+
+            elif sline == "": # skip blank lines
+                continue
+
+            # make sure there are at least 2 'words' in each line
+            elif len(words) < 2:
+                ballot.messages.append("Error in {0}, Line {1}: {2}".format(filename, lineNum, line))
+
+            # make sure the ranking is a number
+            elif not words[0].isdigit():
+                ballot.messages.append("Error in reading {0}, Line {1}: Rank must be an int.".format(filename, lineNum))
+                ballot.error = True
+
+            else:
+                coasterName = words[1]
+                coasterRank = int(words[0])
+
+                # skip coasters ranked zero or less (those weren't ridden)
+                if coasterRank <= 0:
+                    continue
+
+                # check to make sure the coaster on the ballot is legit
+                if coasterName in coasterIndex:
+                    ballot.creditNum += 1
+
+                    # add this voter's ranking of the coaster
+                    coasterAndRank[coasterIndex[coasterName]] = coasterRank
+
+                else: # it's not a legit coaster!
+                    ballot.messages.append("Error in reading {0}, Line {1}: Unknown coaster {2}".format(filename, lineNum, coasterName))
+                    ballot.error = True
+
+    ballot.indices = np.fromiter(coasterAndRank.keys(), dtype=np.intp, count=len(coasterAndRank))
+    ballot.ranks = np.fromiter(coasterAndRank.values(), dtype=np.int32, count=len(coasterAndRank))
+    return ballot
+
+# fingerprint of a ballot's raw bytes
+def contentHash(data):
+    return hashlib.sha256(data).hexdigest()
+
+# read a ballot from raw bytes, decoding them the same way open() would;
+#   with a BallotCache, previously parsed ballots skip the text parsing entirely
+def readBallotBytes(data, filename, coasterIndex, cache=None):
+    dataHash = contentHash(data)
+    ballot = cache.get(dataHash, filename) if cache is not None else None
+    if ballot is None:
+        ballot = readBallot(io.TextIOWrapper(io.BytesIO(data)), filename, coasterIndex)
+        ballot.contentHash = dataHash
+        if cache is not None:
+            cache.put(ballot)
+    ballot.size = len(data)
+    return ballot
+
+# a file that can't be read (say, one deleted mid-run) comes back as a rejected ballot
+def readBallotFile(filepath, coasterIndex, cache=None):
+    try:
+        mtime = os.stat(filepath).st_mtime_ns
+        with open(filepath, "rb") as f:
+            ballot = readBallotBytes(f.read(), os.path.basename(filepath), coasterIndex, cache)
+    except OSError as e:
+        ballot = Ballot(os.path.basename(filepath))
+        ballot.messages.append("Error in reading {0}: {1}".format(ballot.filename, e.strerror))
+        ballot.error = True
+        mtime = 0
+    ballot.path = filepath
+    ballot.mtime = mtime
+    return ballot
+
+# whether the file behind a previously read ballot is still the same; a new
+#   size or mtime only counts as a change if the contents differ too
+def ballotFileUnchanged(ballot, filepath):
+    stat = os.stat(filepath)
+    if stat.st_size == ballot.size and stat.st_mtime_ns == ballot.mtime:
+        return True
+    with open(filepath, "rb") as f:
+        if contentHash(f.read()) != ballot.contentHash:
+            return False
+    ballot.size = stat.st_size
+    ballot.mtime = stat.st_mtime_ns
+    return True
+
+
+
+# ==================================================
+#  read a list of ballots and tally them
+#
+#  ballots with errors are returned but not tallied
+# ==================================================
+
+def tallyBallots(filepaths, winLossMatrix, cache=None):
+    ballots = []
+    for filepath in filepaths:
+        ballot = readBallotFile(filepath, winLossMatrix.index, cache)
+        if not ballot.error:
+            winLossMatrix.addBallot(ballot.indices, ballot.ranks)
+        ballots.append(ballot)
+    return ballots
+
+# worker process entry point: tally a slice of ballots into a fresh partial matrix
+def tallyBallotSlice(filepaths, coasterNames, pairs, cache=None):
+    winLossMatrix = WinLossMatrix(coasterNames, pairs)
+    ballots = tallyBallots(filepaths, winLossMatrix, cache)
+    return winLossMatrix, ballots
+
+# the same, for ballots already read out of an archive as (path, contents) pairs
+def tallyBallotData(members, winLossMatrix, cache=None):
+    ballots = []
+    for path, data in members:
+        ballot = readBallotBytes(data, os.path.basename(path), winLossMatrix.index, cache)
+        ballot.path = path
+        if not ballot.error:
+            winLossMatrix.addBallot(ballot.indices, ballot.ranks)
+        ballots.append(ballot)
+    return ballots
+
+def tallyBallotDataSlice(members, coasterNames, pairs, cache=None):
+    winLossMatrix = WinLossMatrix(coasterNames, pairs)
+    ballots = tallyBallotData(members, winLossMatrix, cache)
+    return winLossMatrix, ballots
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: cache of parsed ballots
+#  Author: Grant Barker
+#
+#  Entries are keyed by the ballot's contents, its file
+#    name (which shows up in voter info and messages), and
+#    the coasters on the blank ballot, so a cached entry
+#    is only ever reused for an identical ballot
+# ==========================================================
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from ballot import Ballot
+from tallyfile import coasterListHash
+
+class BallotCache:
+
+    def __init__(self, folder, coasterNames, maxBytes):
+        self.folder = folder
+        self.blankHash = coasterListHash(coasterNames)
+        self.maxBytes = maxBytes
+
+    def entryPath(self, contentHash, filename):
+        key = hashlib.sha256("\n".join([self.blankHash, contentHash, filename]).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, key[:2], key + ".json")
+
+    # the cached ballot for these contents, or None; a hit counts as a use for eviction
+    def get(self, contentHash, filename):
+        path = self.entryPath(contentHash, filename)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        ballot = Ballot(filename)
+        ballot.voterInfo = entry["voterInfo"]
+        ballot.creditNum = entry["creditNum"]
+        ballot.messages = entry["messages"]
+        ballot.error = entry["error"]
+        ballot.indices = np.array(entry["indices"], dtype=np.intp)
+        ballot.ranks = np.array(entry["ranks"], dtype=np.int32)
+        ballot.contentHash = contentHash
+        return ballot
+
+    def put(self, ballot):
+        path = self.entryPath(ballot.contentHash, ballot.filename)
+        entry = {
+            "voterInfo": ballot.voterInfo,
+            "creditNum": ballot.creditNum,
+            "messages": ballot.messages,
+            "error": ballot.error,
+            "indices": ballot.indices.tolist(),
+            "ranks": ballot.ranks.tolist(),
+        }
+
+        # write to a temporary file first so other workers never see half an entry
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tempPath = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(tempPath, "w") as f:
+                json.dump(entry, f)
+            os.replace(tempPath, path)
+        except OSError:
+            pass
+
+    # delete the least recently used entries until the cache fits in maxBytes
+    def trim(self):
+        entries = []
+        totalBytes = 0
+        for root, dirs, files in os.walk(self.folder):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                totalBytes += stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+                totalBytes -= size
+            except OSError:
+                pass
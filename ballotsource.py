@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: where ballots come from
+#  Author: Grant Barker
+#
+#  A ballot source is either a folder, walked (subfolders
+#    and all) with os.scandir, or a zip or tar archive
+#    (optionally gzip/bzip2/xz compressed), whose members
+#    are streamed out one at a time and never extracted,
+#    or a Maildir/mbox mailbox of emailed ballots
+# ==========================================================
+
+import os
+import re
+import hashlib
+import mailbox
+import tarfile
+import zipfile
+
+ballotExtension = ".txt"
+
+def isBallotArchive(path):
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+# every ballot file under a folder, in order of their paths relative to it
+def scanBallotFolder(folder):
+    found = []
+
+    def scan(path, relative):
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    scan(entry.path, relative + [entry.name])
+                elif entry.is_file() and entry.name.endswith(ballotExtension):
+                    found.append((relative + [entry.name], entry.path))
+
+    scan(folder, [])
+    return [filepath for relative, filepath in sorted(found)]
+
+# (member name, contents) of each ballot in an archive, read once each, in
+#   archive order; a tar archive is read start to end as a single stream
+def readBallotArchive(path):
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(ballotExtension):
+                    yield info.filename, archive.read(info)
+    else:
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(ballotExtension):
+                    yield member.name, archive.extractfile(member).read()
+
+# the key ballots from any source are put in order by, matching scanBallotFolder
+def memberOrder(name):
+    return name.replace("\\", "/").split("/")
+
+# Maildir file names start with when the message was delivered, but their
+#   numbers aren't zero-padded, so compare the runs of digits as numbers
+def deliveryOrder(key):
+    return [int(x) if x.isdigit() else x for x in re.split(r"(\d+)", key)]
+
+# (Message-ID, [(attachment name, contents), ...]) of each message in a Maildir
+#   folder or mbox file, in mailbox order; only .txt attachments are decoded,
+#   and nothing is written to disk
+def readMailbox(path):
+    if os.path.isdir(path):
+        box = mailbox.Maildir(path, factory=None, create=False)
+        keys = sorted(box.keys(), key=deliveryOrder)
+    else:
+        box = mailbox.mbox(path, create=False)
+        keys = box.keys()
+
+    try:
+        for key in keys:
+            message = box.get_message(key)
+
+            # a message without a Message-ID is identified by its contents instead
+            messageID = str(message.get("Message-ID", "")).strip()
+            if not messageID:
+                messageID = "<{0}>".format(hashlib.sha256(message.as_bytes()).hexdigest())
+
+            attachments = []
+            for part in message.walk():
+                name = part.get_filename()
+                if name and name.endswith(ballotExtension) and not part.is_multipart():
+                    attachments.append((os.path.basename(name), part.get_payload(decode=True) or b""))
+            yield messageID, attachments
+    finally:
+        box.close()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: columnar ballot store
+#  Author: Grant Barker
+#
+#  One file holding every ballot in a folder: a voters x
+#    coasters matrix of ranks (0 = not ridden) and one of
+#    where each coaster was listed on the ballot (1 = first
+#    line, 0 = not ridden), memory mapped straight off the
+#    disk, plus a side table of voter info. The text ballots
+#    stay the real source; the store is rebuilt whenever
+#    they change.
+#
+#  Layout: magic, header length, JSON header, zero padding
+#    to a 64-byte boundary, the rank matrix in C order, and
+#    the position matrix, also padded to a 64-byte boundary
+# ==========================================================
+
+import os
+import json
+import struct
+import numpy as np
+
+from ballot import Ballot, ballotFileUnchanged
+from tallyfile import coasterListHash
+
+storeMagic = b"ECBSTORE"
+storeVersion = 2
+storeAlignment = 64
+
+# the smallest unsigned type that holds every rank (or position)
+def rankDtype(maxRank):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if maxRank <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError("rank {0} is too large to store".format(maxRank))
+
+# zero padding needed after offset bytes to reach the next boundary
+def paddingAfter(offset):
+    return -offset % storeAlignment
+
+
+
+# ==================================================
+#  write a store from ballots that were already read
+# ==================================================
+
+def writeStore(path, coasterNames, ballots):
+    maxRank = max([int(b.ranks.max()) for b in ballots if len(b.ranks)] or [0])
+    dtype = rankDtype(maxRank)
+    positionDtype = rankDtype(max([len(b.indices) for b in ballots] or [0]))
+
+    voters = [[b.filename, b.voterInfo, b.creditNum, b.messages, b.error,
+               b.path, b.size, b.mtime, b.contentHash] for b in ballots]
+    header = json.dumps({
+        "version": storeVersion,
+        "coasters": list(coasterNames),
+        "coasterHash": coasterListHash(coasterNames),
+        "dtype": dtype.str,
+        "positionDtype": positionDtype.str,
+        "shape": [len(ballots), len(coasterNames)],
+        "voters": voters,
+    }).encode("utf-8")
+
+    prefixSize = len(storeMagic) + 8 + len(header)
+    padding = paddingAfter(prefixSize)
+
+    # a ballot can list tied coasters in any order, and that order is kept
+    ranks = np.zeros((len(ballots), len(coasterNames)), dtype=dtype)
+    positions = np.zeros((len(ballots), len(coasterNames)), dtype=positionDtype)
+    for row, ballot in enumerate(ballots):
+        ranks[row, ballot.indices] = ballot.ranks
+        positions[row, ballot.indices] = np.arange(1, len(ballot.indices) + 1)
+
+    # write beside the old store and swap it in, so readers never see half a file
+    tempPath = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tempPath, "wb") as f:
+        f.write(storeMagic)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        f.write(ranks.tobytes())
+        f.write(b"\0" * paddingAfter(ranks.nbytes))
+        f.write(positions.tobytes())
+    os.replace(tempPath, path)
+
+
+
+# ==================================================
+#  open a store without reading its rank matrix
+# ==================================================
+
+class BallotStore:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(storeMagic)) != storeMagic:
+                raise ValueError("{0} is not a ballot store".format(path))
+            headerSize = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(headerSize).decode("utf-8"))
+
+        if header["version"] != storeVersion:
+            raise ValueError("{0} is ballot store version {1}; expected {2}".format(
+                path, header["version"], storeVersion))
+        if header["coasterHash"] != coasterListHash(header["coasters"]):
+            raise ValueError("{0} has a corrupt coaster list".format(path))
+
+        self.names = header["coasters"]
+        self.coasterHash = header["coasterHash"]
+        self.voters = header["voters"]
+
+        # an empty matrix can't be mapped, but there's nothing to map anyway
+        offset = len(storeMagic) + 8 + headerSize
+        offset += paddingAfter(offset)
+        shape = tuple(header["shape"])
+        rankType = np.dtype(header["dtype"])
+        positionType = np.dtype(header["positionDtype"])
+        if shape[0] * shape[1] > 0:
+            self.ranks = np.memmap(path, dtype=rankType, mode="r", offset=offset, shape=shape)
+            offset += self.ranks.nbytes
+            offset += paddingAfter(self.ranks.nbytes)
+            self.positions = np.memmap(path, dtype=positionType, mode="r", offset=offset, shape=shape)
+        else:
+            self.ranks = np.zeros(shape, dtype=rankType)
+            self.positions = np.zeros(shape, dtype=positionType)
+
+    def __len__(self):
+        return len(self.voters)
+
+    # let go of the mapping (once no ranks taken from it are left), so the file can be replaced
+    def close(self):
+        self.ranks = None
+        self.positions = None
+
+    # whether the store still matches these ballot files, in this order
+    def isCurrent(self, filepaths):
+        if [voter[5] for voter in self.voters] != list(filepaths):
+            return False
+        for ballot in self.ballots(withRanks=False):
+            try:
+                if not ballotFileUnchanged(ballot, ballot.path):
+                    return False
+            except OSError:
+                return False
+        return True
+
+    # the ballots as Ballot records; their coasters come back in the order they were listed
+    def ballots(self, withRanks=True):
+        ballots = []
+        for row, (filename, voterInfo, creditNum, messages, error, path, size, mtime, contentHash) in enumerate(self.voters):
+            ballot = Ballot(filename)
+            ballot.voterInfo = voterInfo
+            ballot.creditNum = creditNum
+            ballot.messages = messages
+            ballot.error = error
+            ballot.path = path
+            ballot.size = size
+            ballot.mtime = mtime
+            ballot.contentHash = contentHash
+            if withRanks:
+                positions = self.positions[row]
+                listed = np.flatnonzero(positions)
+                ballot.indices = listed[np.argsort(positions[listed])]
+                ballot.ranks = self.ranks[row, ballot.indices].astype(np.int32)
+            ballots.append(ballot)
+        return ballots
@@ -34,7 +34,7 @@ class Coaster:
     overallRank = 0
     tiedCoasters = []
 
-    def __init__(self, fullName, abbrName, rcdblink=None, designerSet=None):
+    def __init__(self, fullName, abbrName, rcdblink=None, designerSet=None, fetchPage=None):
         self.uniqueID = fullName
         self.abbr = abbrName
 
@@ -45,67 +45,78 @@ class Coaster:
             self.park = subwords[1]
             self.location = subwords[2]
 
-        # open URL if rcdblink is provided (time consuming)
         if rcdblink is not None and designerSet is not None:
-            self.rcdb = rcdblink
-
-            # these HTML tools don't work in Python 2.x; return with default values
-            if sys.version_info < (3,0):
-                return
-
-            response = urlopen(rcdblink)
-            html = response.read()
-            soup = BeautifulSoup(html, 'lxml')
-
-            # scan page for a "Make" field, usually at the top
-            for x in soup.body.findAll('div', attrs={'class':'scroll'}):
-                if "Make: " in x.text:
-                    subtext = x.text.split("Make: ", 1)[1]
-
-                    # strip out the "Model" field from the string, if neccessary
-                    if "Model: " in subtext:
-                        subtext = subtext.split("Model: ", 1)[0]
-                    self.designer = subtext
+            self.readRCDB(rcdblink, designerSet, fetchPage)
+
+    # open URL (time consuming), or have fetchPage get it (e.g. from a cache); the link
+    #   is kept even if the page can't be read
+    def readRCDB(self, rcdblink, designerSet, fetchPage=None):
+        self.rcdb = rcdblink
+
+        # these HTML tools don't work in Python 2.x; return with default values
+        if sys.version_info < (3,0):
+            return
+
+        if fetchPage is None:
+            html = urlopen(rcdblink).read()
+        else:
+            html = fetchPage(rcdblink)
+        if html is not None:
+            self.readRCDBPage(html, designerSet)
+
+    # fill in designer and opening year from the HTML of an RCDB page
+    def readRCDBPage(self, html, designerSet):
+        soup = BeautifulSoup(html, 'lxml')
+
+        # scan page for a "Make" field, usually at the top
+        for x in soup.body.findAll('div', attrs={'class':'scroll'}):
+            if "Make: " in x.text:
+                subtext = x.text.split("Make: ", 1)[1]
+
+                # strip out the "Model" field from the string, if neccessary
+                if "Model: " in subtext:
+                    subtext = subtext.split("Model: ", 1)[0]
+                self.designer = subtext
+                break
+
+        # if the "Make" field didn't exist or used an unknown manufacturer, try "Designer" field
+        if self.designer == "" or self.designer not in designerSet:
+            for x in soup.body.findAll('table', attrs={'class':'objDemoBox'}):
+                if "Designer:" in x.text:
+                    subtext = x.text.split("Designer:", 1)[1]
+
+                    # strip out other fields from the string, if neccessary
+                    if "Installer:" in subtext:
+                        subtext = subtext.split("Installer:", 1)[0]
+                    if "Musical Score:" in subtext:
+                        subtext = subtext.split("Musical Score:", 1)[0]
+                    if "Construction Supervisor:" in subtext:
+                        subtext = subtext.split("Construction Supervisor:", 1)[0]
+
+                    # if a known manufacturer is a substring of subtext, use that
+                    alreadyKnownManu = next((y for y in designerSet if y in subtext), False)
+                    if alreadyKnownManu:
+                        self.designer = alreadyKnownManu
+
+                    # otherwise, use the provided "Designer"
+                    elif self.designer == "" and subtext != "":
+                        self.designer = subtext
                     break
 
-            # if the "Make" field didn't exist or used an unknown manufacturer, try "Designer" field
-            if self.designer == "" or self.designer not in designerSet:
-                for x in soup.body.findAll('table', attrs={'class':'objDemoBox'}):
-                    if "Designer:" in x.text:
-                        subtext = x.text.split("Designer:", 1)[1]
-
-                        # strip out other fields from the string, if neccessary
-                        if "Installer:" in subtext:
-                            subtext = subtext.split("Installer:", 1)[0]
-                        if "Musical Score:" in subtext:
-                            subtext = subtext.split("Musical Score:", 1)[0]
-                        if "Construction Supervisor:" in subtext:
-                            subtext = subtext.split("Construction Supervisor:", 1)[0]
-
-                        # if a known manufacturer is a substring of subtext, use that
-                        alreadyKnownManu = next((y for y in designerSet if y in subtext), False)
-                        if alreadyKnownManu:
-                            self.designer = alreadyKnownManu
-
-                        # otherwise, use the provided "Designer"
-                        elif self.designer == "" and subtext != "":
-                            self.designer = subtext
-                        break
-
-            # exception for Gravity Group, who has two names on RCDB for some reason
-            if self.designer == "Gravitykraft Corporation":
-                self.designer = "The Gravity Group, LLC"
-
-            # find an opening year if available
-            d = soup.body.find('time')
-            if d.has_attr('datetime'):
-                self.year = d['datetime'][:4]
-                # if "Operating since " in x.text:
-                #     subtext = x.text.split("Operating since ", 1)[1][:10].split('/')[-1][:4]
-                #     print(x.text)
-                #     self.year = int(subtext)
-                #     break
-                # elif "Operated from " in x.text:
-                #     subtext = x.text.split("Operated from ", 1)[1].split(' ')[0].split('/')[-1]
-                #     self.year = int(subtext)
-                #     break
+        # exception for Gravity Group, who has two names on RCDB for some reason
+        if self.designer == "Gravitykraft Corporation":
+            self.designer = "The Gravity Group, LLC"
+
+        # find an opening year if available
+        d = soup.body.find('time')
+        if d is not None and d.has_attr('datetime'):
+            self.year = d['datetime'][:4]
+            # if "Operating since " in x.text:
+            #     subtext = x.text.split("Operating since ", 1)[1][:10].split('/')[-1][:4]
+            #     print(x.text)
+            #     self.year = int(subtext)
+            #     break
+            # elif "Operated from " in x.text:
+            #     subtext = x.text.split("Operated from ", 1)[1].split(' ')[0].split('/')[-1]
+            #     self.year = int(subtext)
+            #     break
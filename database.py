@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: SQLite ballot database
+#  Author: Grant Barker
+#
+#  Every run can leave behind a database of the coasters,
+#    voters, ballots, and tallies, so follow-up questions
+#    are a query away instead of a re-tabulation:
+#
+#    coasters         one row per coaster on the ballot
+#    voters           one row per ballot file, tallied or not
+#    ballotRows       (voter, coaster, rank) of tallied ballots
+#    coasterTallies   riders and total wins/losses/ties
+#    pairTallies      wins/losses/ties of coasterA vs coasterB,
+#                       coasterA < coasterB, contested pairs only
+#
+#    matchups         view of pairTallies in both directions
+#    coasterResults   view of each coaster's win percentages,
+#                       as on the Ranked Results worksheet
+# ==========================================================
+
+import sqlite3
+
+schemaVersion = 1
+
+schema = """
+CREATE TABLE IF NOT EXISTS coasters (
+    id INTEGER PRIMARY KEY,
+    uniqueID TEXT NOT NULL UNIQUE,
+    name TEXT, park TEXT, location TEXT, abbr TEXT,
+    rcdb TEXT, designer TEXT, year TEXT
+);
+CREATE TABLE IF NOT EXISTS voters (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    name TEXT, email TEXT, city TEXT, state TEXT, country TEXT,
+    credits INTEGER NOT NULL,
+    rejected INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ballotRows (
+    voter INTEGER NOT NULL REFERENCES voters(id),
+    coaster INTEGER NOT NULL REFERENCES coasters(id),
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (voter, coaster)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ballotRowsByCoaster ON ballotRows (coaster, rank);
+CREATE TABLE IF NOT EXISTS coasterTallies (
+    coaster INTEGER PRIMARY KEY REFERENCES coasters(id),
+    riders INTEGER NOT NULL,
+    totalWins INTEGER NOT NULL,
+    totalLosses INTEGER NOT NULL,
+    totalTies INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pairTallies (
+    coasterA INTEGER NOT NULL REFERENCES coasters(id),
+    coasterB INTEGER NOT NULL REFERENCES coasters(id),
+    wins INTEGER NOT NULL,
+    losses INTEGER NOT NULL,
+    ties INTEGER NOT NULL,
+    PRIMARY KEY (coasterA, coasterB)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pairTalliesByB ON pairTallies (coasterB);
+
+CREATE VIEW IF NOT EXISTS matchups AS
+    SELECT coasterA AS coaster, coasterB AS rival, wins, losses, ties FROM pairTallies
+    UNION ALL
+    SELECT coasterB, coasterA, losses, wins, ties FROM pairTallies;
+
+CREATE VIEW IF NOT EXISTS coasterResults AS
+    SELECT c.id AS coaster, c.uniqueID, c.abbr, c.designer,
+           t.riders, t.totalWins, t.totalLosses, t.totalTies,
+           CASE WHEN t.totalWins + t.totalLosses + t.totalTies > 0
+                THEN (t.totalWins + t.totalTies / 2.0) * 100.0 / (t.totalWins + t.totalLosses + t.totalTies)
+                ELSE 0.0 END AS totalWinPercentage,
+           IFNULL(m.pairwiseWins, 0) AS pairwiseWins,
+           IFNULL(m.pairwiseLosses, 0) AS pairwiseLosses,
+           IFNULL(m.pairwiseTies, 0) AS pairwiseTies,
+           CASE WHEN m.pairContests > 0
+                THEN (m.pairwiseWins + m.pairwiseTies / 2.0) * 100.0 / m.pairContests
+                ELSE 0.0 END AS pairwiseWinPercentage
+    FROM coasters c
+    JOIN coasterTallies t ON t.coaster = c.id
+    LEFT JOIN (SELECT coaster,
+                      SUM(wins > losses) AS pairwiseWins,
+                      SUM(wins < losses) AS pairwiseLosses,
+                      SUM(wins = losses) AS pairwiseTies,
+                      COUNT(*) AS pairContests
+               FROM matchups GROUP BY coaster) m ON m.coaster = c.id;
+"""
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, schemaVersion):
+        conn.close()
+        raise ValueError("{0} is database version {1}; expected {2}".format(path, version, schemaVersion))
+    conn.executescript(schema)
+    conn.execute("PRAGMA user_version = {0}".format(schemaVersion))
+    return conn
+
+
+
+# ==================================================
+#  replace everything in the database with one run's
+#    coasters, ballots, and tallies
+#
+#  it all happens in one transaction, so a reader
+#    sees either the old run or the new one
+# ==================================================
+
+def writeDatabase(path, coasterDict, winLossMatrix, ballots):
+    conn = connect(path)
+    try:
+        with conn:
+            for table in ("pairTallies", "coasterTallies", "ballotRows", "voters", "coasters"):
+                conn.execute("DELETE FROM {0}".format(table))
+
+            conn.executemany("INSERT INTO coasters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((i, name, c.name, c.park, c.location, c.abbr, c.rcdb, c.designer, c.year)
+                 for i, name in enumerate(winLossMatrix.names) for c in [coasterDict[name]]))
+
+            conn.executemany("INSERT INTO voters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ([v] + b.voterInfo + [b.creditNum, int(b.error)] for v, b in enumerate(ballots)))
+
+            conn.executemany("INSERT INTO ballotRows VALUES (?, ?, ?)",
+                ((v, i, r) for v, b in enumerate(ballots) if not b.error
+                 for i, r in zip(b.indices.tolist(), b.ranks.tolist())))
+
+            m = winLossMatrix
+            conn.executemany("INSERT INTO coasterTallies VALUES (?, ?, ?, ?, ?)",
+                zip(range(m.size), m.riders.tolist(), m.totalWins.tolist(),
+                    m.totalLosses.tolist(), m.totalTies.tolist()))
+
+            pairKeys, wins, losses, ties = m.pairTallies()
+            rows, cols = m.pairCoasters(pairKeys)
+            conn.executemany("INSERT INTO pairTallies VALUES (?, ?, ?, ?, ?)",
+                zip(rows.tolist(), cols.tolist(), wins.tolist(), losses.tolist(), ties.tolist()))
+    finally:
+        conn.close()
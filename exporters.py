@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: plain result exporters
+#  Author: Grant Barker
+#
+#  Tables of results written a row at a time as CSV or
+#    JSON Lines, or as Parquet if pyarrow is installed,
+#    for tools that would rather not parse a workbook.
+#    Columns are (name, type), type being "int", "float",
+#    or "str"; any value may be None.
+# ==========================================================
+
+import csv
+import json
+
+# nonessential imports
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+exportFormats = ["csv", "jsonl", "parquet"]
+
+class CSVExporter:
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, kind in columns])
+
+    def writeRow(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+class JSONLinesExporter:
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8")
+        self.names = [name for name, kind in columns]
+
+    def writeRow(self, row):
+        self.file.write(json.dumps(dict(zip(self.names, row)), ensure_ascii=False))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+# Parquet is written a row group at a time, so only one row group is ever held
+class ParquetExporter:
+
+    rowGroupSize = 65536
+    types = {"int": "int64", "float": "float64", "str": "string"}
+
+    def __init__(self, path, columns):
+        self.schema = pyarrow.schema([(name, self.types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def writeRow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.rowGroupSize:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            columns = zip(*self.rows)
+            self.writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+                schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def openExporter(path, exportFormat, columns):
+    if exportFormat == "csv":
+        return CSVExporter(path, columns)
+    if exportFormat == "jsonl":
+        return JSONLinesExporter(path, columns)
+    if exportFormat == "parquet":
+        if pyarrow is None:
+            raise ValueError("exporting Parquet requires pyarrow")
+        return ParquetExporter(path, columns)
+    raise ValueError("unknown export format {0}".format(exportFormat))
+
+def exportAvailable(exportFormat):
+    return exportFormat != "parquet" or pyarrow is not None
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Checks reading ballots from a mailbox against the mbox and Maildir fixtures:
+#   only .txt attachments are read, and with --snapshot, importing an updated
+#   mailbox only reads the messages with new Message-IDs (a message sent again
+#   with an old Message-ID is ignored)
+# Author: Grant Barker
+
+import os
+import re
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    from ballotsource import readMailbox
+except:
+    print('Could not find "ballotsource.py"; exiting...')
+    sys.exit()
+try:
+    from tallyfile import loadTally
+except:
+    print('Could not find "tallyfile.py"; exiting...')
+    sys.exit()
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# command line arguments
+parser = argparse.ArgumentParser(description='Check reading ballots from mailboxes.')
+
+parser.add_argument("-b", "--blankBallot", default=os.path.join(here, "old-ballots", "blankballot2018_rcdb.txt"),
+                    help="specify blank ballot file the fixture ballots were filled in from")
+parser.add_argument("--fixtures", default=os.path.join(here, "fixtures", "mailbox"),
+                    help="specify folder of mailbox fixtures")
+
+args = parser.parse_args()
+
+failures = 0
+
+def check(description, passed):
+    global failures
+    print("{0}: {1}".format("ok" if passed else "FAILED", description))
+    if not passed:
+        failures += 1
+
+# import a mailbox into a snapshot; returns (new messages, new ballots, ballots in all)
+def importMailbox(mailboxPath, snapshot, folder):
+    output = subprocess.run([sys.executable, os.path.join(here, "tabulator.py"), "-b", args.blankBallot,
+                             "--mailbox", mailboxPath, "--snapshot", snapshot, "-m", "1", "--no-cache",
+                             "--sheets", "results", "-t", "-o", os.path.join(folder, "results.xlsx")],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    found = re.search(r"([0-9]+) new messages with ([0-9]+) ballots; ([0-9]+) ballots in all", output)
+    return tuple(int(x) for x in found.groups()) if found else None
+
+# Alice's first ballot ranked PNE first of three, and the copy sent again ranked it
+#   last; with Bob's ballot (PNE last of three), PNE has 2 riders and 2 wins only
+#   if the first is counted, and just once
+def keptFirstBallot(snapshot):
+    try:
+        winLossMatrix, ballots, header = loadTally(snapshot)
+    except (OSError, ValueError, KeyError):
+        return False
+    pne = winLossMatrix.index["Coaster-PNE Playland-CANDA"]
+    return winLossMatrix.riders[pne] == 2 and winLossMatrix.totalWins[pne] == 2
+
+def checkMailbox(kind, mailboxPath, update, snapshot, folder):
+    # besides them, the messages have a .jpg, a .pdf, and a .txt.bak attached, and a text body
+    attachmentNames = [[name for name, data in attachments] for messageID, attachments in readMailbox(mailboxPath)]
+    check("{0}: only .txt attachments are read".format(kind), attachmentNames == [["alice.txt"], ["bob.txt"]])
+
+    check("{0}: first import reads every message".format(kind), importMailbox(mailboxPath, snapshot, folder) == (2, 2, 2))
+    check("{0}: importing it again reads nothing".format(kind), importMailbox(mailboxPath, snapshot, folder) == (0, 0, 2))
+
+    update()
+    check("{0}: an updated import reads only the new Message-ID".format(kind),
+          importMailbox(mailboxPath, snapshot, folder) == (1, 1, 3))
+    check("{0}: a message sent again with an old Message-ID is ignored".format(kind), keptFirstBallot(snapshot))
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        # mbox: the whole file is replaced by a longer one, as a mail client would append to it
+        mboxPath = os.path.join(folder, "ballots.mbox")
+        shutil.copy(os.path.join(args.fixtures, "ballots.mbox"), mboxPath)
+        checkMailbox("mbox", mboxPath,
+                     lambda: shutil.copy(os.path.join(args.fixtures, "ballots-updated.mbox"), mboxPath),
+                     os.path.join(folder, "mbox.npz"), folder)
+
+        # Maildir: new messages are delivered into new/
+        maildirPath = os.path.join(folder, "maildir")
+        shutil.copytree(os.path.join(args.fixtures, "maildir"), maildirPath)
+        def deliver():
+            updates = os.path.join(args.fixtures, "maildir-update", "new")
+            for name in os.listdir(updates):
+                shutil.copy(os.path.join(updates, name), os.path.join(maildirPath, "new", name))
+        checkMailbox("Maildir", maildirPath, deliver, os.path.join(folder, "maildir.npz"), folder)
+
+    if failures:
+        print("{0} checks failed.".format(failures))
+        sys.exit(1)
+    print("All checks passed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: win/loss matrix engine
+#  Author: Grant Barker
+# ==========================================================
+
+import numpy as np
+
+# pending pair tallies are summed in once there are more of them than stored
+#   pairs, but never fewer than this many at a time
+pendingMinimum = 1 << 16
+
+class WinLossMatrix:
+
+    def __init__(self, coasterNames, pairs=True):
+        self.names = list(coasterNames)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.size = len(self.names)
+
+        # a totals-only matrix never stores or fills any pairwise tallies
+        self.pairs = pairs
+
+        # every unordered pair (a, b) with a < b has a position ("key") in the
+        #   order of the upper triangle of an NxN matrix, but only the pairs that
+        #   at least one voter rode both of are stored: their keys, sorted, and
+        #   their tallies at the same places; "wins" counts the ballots where a
+        #   outranked b and "losses" the ones where b outranked a
+        self.rowStarts = self.pairIndex(np.arange(self.size), np.arange(self.size) + 1)
+        self.pairKeys = np.zeros(0, dtype=np.int64)
+        self.wins = np.zeros(0, dtype=np.int32)
+        self.losses = np.zeros(0, dtype=np.int32)
+        self.ties = np.zeros(0, dtype=np.int32)
+
+        # tallies added since, as (keys, wins, losses, ties) chunks; they're summed
+        #   into the stored ones before anything reads those (see compact), so the
+        #   stored arrays are only ever replaced, never changed in place
+        self.pending = []
+        self.pendingSize = 0
+
+        # per-coaster tallies over every ballot
+        self.riders = np.zeros(self.size, dtype=np.int32)
+        self.totalWins = np.zeros(self.size, dtype=np.int32)
+        self.totalLosses = np.zeros(self.size, dtype=np.int32)
+        self.totalTies = np.zeros(self.size, dtype=np.int32)
+
+        # pair positions within a ballot of k coasters, cached by k
+        self.ballotPairs = {}
+
+        # filled in by calculate(): the keys of the contested pairs, their number
+        #   of contests, and their win percentages from the perspective of the
+        #   lower-indexed coaster
+        self.contestedPairs = np.zeros(0, dtype=np.int64)
+        self.contests = np.zeros(0, dtype=np.int32)
+        self.winPercentage = np.zeros(0)
+        self.lossPercentage = np.zeros(0)
+
+    # ship only the summed tallies between processes; the index arrays are rebuilt on arrival
+    def __getstate__(self):
+        self.compact()
+        state = self.__dict__.copy()
+        for key in ("index", "rowStarts", "ballotPairs"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.rowStarts = self.pairIndex(np.arange(self.size), np.arange(self.size) + 1)
+        self.ballotPairs = {}
+
+    # an independent copy of the tallies, sharing the read-only index arrays
+    def copy(self):
+        self.compact()
+        other = WinLossMatrix.__new__(WinLossMatrix)
+        other.__dict__.update(self.__dict__)
+        for key in ("riders", "totalWins", "totalLosses", "totalTies", "pairKeys", "wins", "losses", "ties",
+                    "winPercentage", "lossPercentage"):
+            setattr(other, key, getattr(self, key).copy())
+        other.pending = []
+        other.ballotPairs = {}
+        return other
+
+    # number of ordered (coasterA, coasterB) pairings
+    def __len__(self):
+        return self.size * (self.size - 1) if self.pairs else 0
+
+    # position of the pair (a, b) in the upper triangle; requires a < b
+    def pairIndex(self, a, b):
+        return a * self.size - (a * (a + 1)) // 2 + (b - a - 1)
+
+    # the coaster indices (a, b) of each pair position, the reverse of pairIndex
+    def pairCoasters(self, k):
+        a = np.searchsorted(self.rowStarts, k, side="right") - 1
+        return a, k - self.rowStarts[a] + a + 1
+
+    # add one ballot, given as arrays of distinct coaster indices and their ranks;
+    #   a weight of -1 takes back a ballot that was added earlier
+    def addBallot(self, indices, ranks, weight=1):
+        indices = np.asarray(indices, dtype=np.intp)
+        ranks = np.asarray(ranks)
+        if len(indices) == 0:
+            return
+
+        # each coaster beats every coaster ranked below it and loses to every
+        #   coaster ranked above it, so a sorted copy of the ranks gives the totals
+        sortedRanks = np.sort(ranks)
+        above = np.searchsorted(sortedRanks, ranks, side="left")
+        below = len(ranks) - np.searchsorted(sortedRanks, ranks, side="right")
+        self.riders[indices] += weight
+        self.totalWins[indices] += weight * below
+        self.totalLosses[indices] += weight * above
+        self.totalTies[indices] += weight * (len(ranks) - above - below - 1)
+        if not self.pairs:
+            return
+
+        # order by coaster index so every ballot pair (i, j) with i < j maps to a < b
+        order = np.argsort(indices)
+        indices = indices[order]
+        ranks = ranks[order]
+        if len(indices) not in self.ballotPairs:
+            self.ballotPairs[len(indices)] = np.triu_indices(len(indices), k=1)
+        i, j = self.ballotPairs[len(indices)]
+
+        # every pair on the ballot is exactly one of a win, a loss, or a tie
+        won = (ranks[i] < ranks[j]).astype(np.int32) * np.int32(weight)
+        lost = (ranks[i] > ranks[j]).astype(np.int32) * np.int32(weight)
+        self.addPending(self.pairIndex(indices[i], indices[j]).astype(np.int64), won, lost, np.int32(weight) - won - lost)
+
+    def removeBallot(self, indices, ranks):
+        self.addBallot(indices, ranks, weight=-1)
+
+    # queue up tallies for these pair keys (in any order, repeats allowed)
+    def addPending(self, keys, wins, losses, ties):
+        if len(keys) == 0:
+            return
+        self.pending.append((keys, wins, losses, ties))
+        self.pendingSize += len(keys)
+        if self.pendingSize > max(len(self.pairKeys), pendingMinimum):
+            self.compact()
+
+    # sum the pending tallies into the stored ones; a pair whose tallies all come
+    #   to zero (its only ballots were taken back) isn't stored any more
+    def compact(self):
+        if not self.pending:
+            return
+        chunks = [(self.pairKeys, self.wins, self.losses, self.ties)] + self.pending
+        self.pending = []
+        self.pendingSize = 0
+
+        # sort every key, then sum each run of equal ones
+        keys = np.concatenate([chunk[0] for chunk in chunks])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        firsts = np.flatnonzero(np.diff(keys, prepend=-1))
+        sums = [np.add.reduceat(np.concatenate([chunk[t] for chunk in chunks])[order], firsts) for t in (1, 2, 3)]
+
+        stored = (sums[0] != 0) | (sums[1] != 0) | (sums[2] != 0)
+        self.pairKeys = keys[firsts][stored]
+        self.wins, self.losses, self.ties = [tally[stored].astype(np.int32) for tally in sums]
+
+    # the keys and wins, losses, and ties of every contested pair, in key order
+    def pairTallies(self):
+        self.compact()
+        return self.pairKeys, self.wins, self.losses, self.ties
+
+    # whether each pair key in k (an array of any shape) is stored, and its tallies if it is
+    def lookup(self, k):
+        keys, wins, losses, ties = self.pairTallies()
+        if len(keys) == 0:
+            zeros = np.zeros(np.shape(k), dtype=np.int32)
+            return np.zeros(np.shape(k), dtype=bool), zeros, zeros, zeros
+        slots = np.minimum(np.searchsorted(keys, k), len(keys) - 1)
+        return keys[slots] == k, wins[slots], losses[slots], ties[slots]
+
+    # add the tallies of another matrix built over the same coasters; a
+    #   totals-only matrix can absorb a full one, but not the other way around
+    def merge(self, other):
+        if other.names != self.names:
+            raise ValueError("can only merge matrices built from the same blank ballot")
+        if self.pairs and not other.pairs:
+            raise ValueError("can't merge a totals-only matrix into a full one")
+        self.riders += other.riders
+        self.totalWins += other.totalWins
+        self.totalLosses += other.totalLosses
+        self.totalTies += other.totalTies
+        if self.pairs:
+            self.addPending(*other.pairTallies())
+
+    # wins, losses, and ties of coaster index a against coaster index b
+    def counts(self, a, b):
+        wins, losses, ties = self.pairCounts(a, b)
+        return int(wins), int(losses), int(ties)
+
+    # wins, losses, and ties of each coaster in a against the coaster at the same
+    #   place in b (arrays of any matching shape); a coaster is 0-0-0 against itself,
+    #   and against any coaster it was never ranked with
+    def pairCounts(self, a, b):
+        a = np.asarray(a, dtype=np.intp)
+        b = np.asarray(b, dtype=np.intp)
+        stored, pairWins, pairLosses, pairTies = self.lookup(self.pairIndex(np.minimum(a, b), np.maximum(a, b)))
+        found = stored & (a != b)
+        flipped = a > b
+        wins = np.where(found, np.where(flipped, pairLosses, pairWins), 0)
+        losses = np.where(found, np.where(flipped, pairWins, pairLosses), 0)
+        ties = np.where(found, pairTies, 0)
+        return wins, losses, ties
+
+    # full NxN wins/losses/ties of row coaster vs column coaster
+    def denseCounts(self):
+        keys, pairWins, pairLosses, pairTies = self.pairTallies()
+        a, b = self.pairCoasters(keys)
+        wins = np.zeros((self.size, self.size), dtype=np.int32)
+        wins[a, b] = pairWins
+        wins[b, a] = pairLosses
+        ties = np.zeros((self.size, self.size), dtype=np.int32)
+        ties[a, b] = pairTies
+        ties[b, a] = pairTies
+        return wins, wins.T, ties
+
+    # full NxN win percentage of row coaster vs column coaster
+    def densePercentages(self):
+        a, b = self.pairCoasters(self.contestedPairs)
+        percentages = np.zeros((self.size, self.size))
+        percentages[a, b] = self.winPercentage
+        percentages[b, a] = self.lossPercentage
+        return percentages
+
+    # compute contested pairs' win percentages and each coaster's pairwise wins/losses/ties
+    def calculate(self):
+        self.contestedPairs, wins, losses, ties = self.pairTallies()
+        self.contests = wins + losses + ties
+
+        self.winPercentage = (wins + ties / 2) / self.contests * 100
+        self.lossPercentage = (losses + ties / 2) / self.contests * 100
+
+        a, b = self.pairCoasters(self.contestedPairs)
+        ahead = wins > losses
+        behind = wins < losses
+        even = wins == losses
+
+        def tally(rowMask, colMask):
+            return (np.bincount(a[rowMask], minlength=self.size) +
+                    np.bincount(b[colMask], minlength=self.size))
+
+        return tally(ahead, behind), tally(behind, ahead), tally(even, even)
+
+    # every ordered pair sorted by win percentage (ties keep row-major order),
+    #   returned as arrays of primary index, rival index, win percentage, and rank
+    #
+    #   only the contested pairs are stored, so those above 0% are sorted, and the
+    #   pairs at 0% follow them in row-major order: contested pairs with no wins
+    #   or ties, and (without minContests) the uncontested pairs, which are found
+    #   in the gaps between the listed ones; they all share one rank, so which
+    #   come first is only order
+    #
+    #   minContests leaves out pairs with fewer contests
+    #
+    #   top keeps just the first top pairs of that order, with the same ranks: only
+    #   the top-th highest percentage is found, by partitioning, and only the pairs
+    #   at or above it are sorted; 0% pairs are only listed if top reaches them
+    def rankPairs(self, minContests=0, top=None):
+        a, b = self.pairCoasters(self.contestedPairs)
+        allPrimary = np.concatenate([a, b])
+        allRival = np.concatenate([b, a])
+        allPercentages = np.concatenate([self.winPercentage, self.lossPercentage])
+        enough = np.concatenate([self.contests, self.contests]) >= minContests
+
+        above = enough & (allPercentages > 0)
+        rowMajor = np.argsort(allPrimary[above] * self.size + allRival[above])
+        primary = allPrimary[above][rowMajor]
+        rival = allRival[above][rowMajor]
+        percentages = allPercentages[above][rowMajor]
+
+        if top is not None and top < len(percentages):
+            # every pair above the cutoff makes it, and pairs right at it fill the
+            #   rest in row-major order, as they would have in a full stable sort
+            cutoff = np.partition(percentages, len(percentages) - top)[len(percentages) - top]
+            chosen = percentages > cutoff
+            chosen[np.flatnonzero(percentages == cutoff)[:top - np.count_nonzero(chosen)]] = True
+            primary, rival, percentages = primary[chosen], rival[chosen], percentages[chosen]
+
+        order = np.argsort(-percentages, kind="stable")
+        primary, rival, percentages = primary[order], rival[order], percentages[order]
+
+        if top is None or top > len(percentages):
+            if minContests > 0:
+                atZero = enough & (allPercentages == 0)
+                zeroPairs = np.sort(allPrimary[atZero] * self.size + allRival[atZero])
+                if top is not None:
+                    zeroPairs = zeroPairs[:top - len(percentages)]
+            else:
+                # every ordered pair (as primary * N + rival) but a coaster against
+                #   itself or one above 0%; with those left out sorted, the m-th
+                #   pair left is m plus the number left out whose value, less the
+                #   number left out before them, is at most m
+                leftOut = np.union1d(allPrimary[above] * self.size + allRival[above],
+                                     np.arange(self.size) * (self.size + 1))
+                count = self.size * self.size - len(leftOut)
+                if top is not None:
+                    count = min(count, top - len(percentages))
+                m = np.arange(count)
+                zeroPairs = m + np.searchsorted(leftOut - np.arange(len(leftOut)), m, side="right")
+            zeroPrimary, zeroRival = np.divmod(zeroPairs, self.size)
+            primary = np.concatenate([primary, zeroPrimary])
+            rival = np.concatenate([rival, zeroRival])
+            percentages = np.concatenate([percentages, np.zeros(len(zeroPairs))])
+
+        return primary, rival, percentages, sharedRanks(percentages)
+
+
+
+# ==================================================
+#  rank a list of values sorted in descending order
+#
+#  equal values share the rank of the first of them;
+#    a leading run of zeros is left unranked (0)
+# ==================================================
+
+def sharedRanks(values):
+    ranks = np.zeros(len(values), dtype=np.int64)
+    if len(values) == 0 or values[0] == 0.0:
+        return ranks
+
+    firsts = np.ones(len(values), dtype=bool)
+    firsts[1:] = values[1:] != values[:-1]
+    positions = np.arange(1, len(values) + 1)
+    return np.maximum.accumulate(np.where(firsts, positions, 0))
+
+
+
+# ==================================================
+#  Mitch Hawker-style "W 12-3-1" cells of a set of
+#    coasters against each other
+#
+#  built once, then read back with its rows and
+#    columns in any order of the same coasters
+# ==================================================
+
+class HawkerGrid:
+
+    def __init__(self, winLossMatrix, indices):
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.position = {a: p for p, a in enumerate(self.indices.tolist())}
+
+        wins, losses, ties = winLossMatrix.pairCounts(self.indices[:, np.newaxis], self.indices[np.newaxis, :])
+
+        # 1 where the row coaster won the pair, -1 where it lost, 0 where they tied
+        self.outcomes = np.sign(wins.astype(np.int64) - losses).astype(np.int8)
+        letters = np.array(["L ", "T ", "W "])[self.outcomes + 1]
+        self.cells = letters
+        for part in (wins.astype(str), "-", losses.astype(str), "-", ties.astype(str)):
+            self.cells = np.char.add(self.cells, part)
+
+        # a coaster doesn't face itself
+        offDiagonal = ~np.eye(len(self.indices), dtype=bool)
+        self.cells[~offDiagonal] = ""
+        self.pairWins = ((self.outcomes > 0) & offDiagonal).sum(axis=1)
+        self.pairLosses = ((self.outcomes < 0) & offDiagonal).sum(axis=1)
+        self.pairTies = ((self.outcomes == 0) & offDiagonal).sum(axis=1)
+
+    # positions in the grid of these coaster indices
+    def positions(self, indices):
+        return np.array([self.position[a] for a in indices], dtype=np.intp)
+
+    # the cells with rows and columns in the order of these coaster indices
+    def cellsInOrder(self, indices):
+        p = self.positions(indices)
+        return self.cells[np.ix_(p, p)]
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Checks the cache of RCDB pages against a folder of saved pages standing in for
+#   rcdb.com: fetching, using cached pages, revalidating with ETag/304, refetching
+#   changed pages, falling back to stale pages, offline mode, and reading designers
+#   and years off the pages; nothing touches the network
+# Author: Grant Barker
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+try:
+    from rcdbcache import RCDBCache, folderFetcher
+except:
+    print('Could not find "rcdbcache.py"; exiting...')
+    sys.exit()
+try:
+    from coaster import Coaster
+except:
+    print('Could not find "coaster.py"; exiting...')
+    sys.exit()
+try:
+    from wood import designers
+except:
+    print('Could not find "wood.py"; exiting...')
+    sys.exit()
+
+# command line arguments
+parser = argparse.ArgumentParser(description='Check the RCDB page cache against saved pages.')
+
+parser.add_argument("--rcdbFixtures", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "rcdb"),
+                    help="specify folder of saved RCDB pages (must include 320.htm and 61.htm)")
+
+args = parser.parse_args()
+
+failures = 0
+
+def check(description, passed):
+    global failures
+    print("{0}: {1}".format("ok" if passed else "FAILED", description))
+    if not passed:
+        failures += 1
+
+# a fetch function that remembers the headers of every request it's handed
+def recordingFetcher(fetch, requests):
+    def recordingFetch(url, headers):
+        requests.append((url, dict(headers)))
+        return fetch(url, headers)
+    return recordingFetch
+
+def unreachable(url, headers):
+    raise OSError("RCDB is unreachable")
+
+def main():
+    url = "https://rcdb.com/320.htm"
+    with tempfile.TemporaryDirectory() as folder:
+        pages = os.path.join(folder, "pages")
+        shutil.copytree(args.rcdbFixtures, pages)
+        cacheFolder = os.path.join(folder, "cache")
+        with open(os.path.join(pages, "320.htm"), "rb") as f:
+            original = f.read()
+
+        requests = []
+        fetch = recordingFetcher(folderFetcher(pages), requests)
+
+        # an empty cache fetches the page, and keeps its ETag
+        cache = RCDBCache(cacheFolder, 3600, fetch=fetch)
+        check("an uncached page is fetched", cache.get(url) == original and cache.fetched == 1)
+        info, page = cache.load(url)
+        check("a fetched page is kept with its ETag", page == original and bool(info and info["etag"]))
+
+        # within maxAge, the cached page is used without a request
+        del requests[:]
+        cache = RCDBCache(cacheFolder, 3600, fetch=fetch)
+        check("a fresh page comes from the cache", cache.get(url) == original and cache.cached == 1 and not requests)
+
+        # past maxAge, an unchanged page is revalidated with its ETag and kept
+        cache = RCDBCache(cacheFolder, 0, fetch=fetch)
+        check("an old, unchanged page is revalidated (304)", cache.get(url) == original and cache.revalidated == 1)
+        check("revalidation sends If-None-Match", bool(requests) and requests[-1][1].get("If-None-Match") == info["etag"])
+        newInfo, page = cache.load(url)
+        check("revalidation renews the fetch time", newInfo["fetched"] > info["fetched"])
+
+        # past maxAge, a changed page is fetched again
+        changed = original.replace(b"Carl Phare", b"Walker LeRoy")
+        with open(os.path.join(pages, "320.htm"), "wb") as f:
+            f.write(changed)
+        cache = RCDBCache(cacheFolder, 0, fetch=fetch)
+        check("an old, changed page is fetched again", cache.get(url) == changed and cache.fetched == 1)
+
+        # a stale page beats no page when RCDB can't be reached
+        cache = RCDBCache(cacheFolder, 0, fetch=unreachable)
+        check("a stale page is used when RCDB can't be reached", cache.get(url) == changed and cache.cached == 1)
+
+        # offline, cached pages are used however old, and nothing is ever requested
+        del requests[:]
+        cache = RCDBCache(cacheFolder, 0, offline=True, fetch=fetch)
+        check("offline, an old cached page is used", cache.get(url) == changed and cache.cached == 1)
+        check("offline, an uncached page is unavailable",
+              cache.get("https://rcdb.com/61.htm") is None and cache.missing == 1)
+        check("offline, nothing is requested", not requests)
+
+        # designers and years are read off the pages
+        cache = RCDBCache(os.path.join(folder, "cache2"), 3600, fetch=folderFetcher(args.rcdbFixtures))
+        c = Coaster("Coaster-PNE Playland-CANDA", "CoasterPNE", url, designers.keys(), cache.get)
+        check("a designer is read from the Designer field", c.designer == "Carl Phare" and c.year == "1958")
+        c = Coaster("Ghoster Coaster-Canadas Wonderland-CANDA", "GhostrCoCW", "https://rcdb.com/61.htm",
+                    designers.keys(), cache.get)
+        check("a designer is read from the Make field",
+              c.designer == "Philadelphia Toboggan Coasters, Inc." and c.year == "1981")
+        c = Coaster("Cyclops-Mt Olympus-USAWI", "CyclopsMtO", "https://rcdb.com/161.htm", designers.keys(), cache.get)
+        check("a missing page leaves a coaster without RCDB details",
+              c.designer == "" and c.year == "" and c.rcdb == "https://rcdb.com/161.htm")
+
+    if failures:
+        print("{0} checks failed.".format(failures))
+        sys.exit(1)
+    print("All checks passed.")
+
+if __name__ == "__main__":
+    main()
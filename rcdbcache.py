@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: cache of RCDB pages
+#  Author: Grant Barker
+#
+#  Pages are kept on disk by URL, with when they were
+#    fetched and their ETag/Last-Modified headers. A page
+#    younger than maxAge is used as is; an older one is
+#    revalidated with a conditional request, and kept if
+#    the server says it hasn't changed (or can't be
+#    reached). Offline, only cached pages are ever used.
+#
+#  The HTTP layer is any function fetch(url, headers)
+#    returning (status, headers, body), so a stand-in
+#    server or a folder of saved pages can replace RCDB.
+#    PoliteFetcher wraps one to pace requests to each host
+#    and retry failures, so pages can be fetched from
+#    several threads without hammering RCDB.
+# ==========================================================
+
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+# fetch a URL over HTTP; a 304 (or any error status) comes back rather than raising
+def fetchURL(url, headers, timeout=30):
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+            return response.status, dict(response.headers), response.read()
+    except HTTPError as e:
+        return e.code, dict(e.headers or {}), b""
+
+# a fetch function that serves saved pages from a folder, named by the last part
+#   of their URL (e.g. "320.htm" for https://rcdb.com/320.htm); like a server, it
+#   tags each page with an ETag and answers a request for an unchanged page with 304
+def folderFetcher(folder):
+    def fetch(url, headers):
+        try:
+            with open(os.path.join(folder, url.rstrip("/").rsplit("/", 1)[-1]), "rb") as f:
+                page = f.read()
+        except OSError:
+            return 404, {}, b""
+        etag = '"{0}"'.format(hashlib.sha256(page).hexdigest()[:16])
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag}, page
+    return fetch
+
+# paces requests to at most rate per second per host, and retries connection errors
+#   and 429/5xx responses up to retries times, waiting backoff seconds, then twice
+#   that, and so on (or as long as the server's Retry-After asks)
+class PoliteFetcher:
+
+    def __init__(self, fetch=fetchURL, rate=4.0, retries=3, backoff=1.0):
+        self.fetch = fetch
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.nextRequest = {} # host: earliest time of its next request
+
+    # wait for this request's turn with the host
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            turn = max(now, self.nextRequest.get(host, now))
+            self.nextRequest[host] = turn + self.interval
+        if turn > now:
+            time.sleep(turn - now)
+
+    def __call__(self, url, headers):
+        for attempt in range(self.retries + 1):
+            self.wait(url)
+            delay = self.backoff * 2 ** attempt
+            try:
+                status, responseHeaders, body = self.fetch(url, headers)
+            except OSError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if (status != 429 and status < 500) or attempt == self.retries:
+                    return status, responseHeaders, body
+                retryAfter = {k.lower(): v for k, v in responseHeaders.items()}.get("retry-after", "")
+                if retryAfter.isdigit():
+                    delay = max(delay, int(retryAfter))
+            time.sleep(delay)
+
+class RCDBCache:
+
+    def __init__(self, folder, maxAge, offline=False, fetch=fetchURL):
+        self.folder = folder
+        self.maxAge = maxAge
+        self.offline = offline
+        self.fetch = fetch
+
+        # how each page was found, for the summary after a run
+        self.cached = 0
+        self.revalidated = 0
+        self.fetched = 0
+        self.missing = 0
+        self.lock = threading.Lock() # pages may be gotten from several threads at once
+
+    def count(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def entryPaths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.folder, key[:2], key)
+        return base + ".html", base + ".json"
+
+    def load(self, url):
+        pagePath, infoPath = self.entryPaths(url)
+        try:
+            with open(infoPath) as f:
+                info = json.load(f)
+            with open(pagePath, "rb") as f:
+                return info, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    # write to temporary files first (one per thread), so a reader never sees half an entry
+    def save(self, url, info, page=None):
+        pagePath, infoPath = self.entryPaths(url)
+        try:
+            os.makedirs(os.path.dirname(infoPath), exist_ok=True)
+            if page is not None:
+                tempPath = "{0}.{1}.{2}.tmp".format(pagePath, os.getpid(), threading.get_ident())
+                with open(tempPath, "wb") as f:
+                    f.write(page)
+                os.replace(tempPath, pagePath)
+            tempPath = "{0}.{1}.{2}.tmp".format(infoPath, os.getpid(), threading.get_ident())
+            with open(tempPath, "w") as f:
+                json.dump(info, f)
+            os.replace(tempPath, infoPath)
+        except OSError:
+            pass
+
+    # the page at url, from the cache or the network; None if it can't be had
+    def get(self, url):
+        info, page = self.load(url)
+        if page is not None and (self.offline or time.time() - info["fetched"] < self.maxAge):
+            self.count("cached")
+            return page
+        if self.offline:
+            self.count("missing")
+            return None
+
+        headers = {}
+        if page is not None:
+            if info.get("etag"):
+                headers["If-None-Match"] = info["etag"]
+            if info.get("lastModified"):
+                headers["If-Modified-Since"] = info["lastModified"]
+
+        # an old page beats no page when RCDB can't be reached
+        try:
+            status, responseHeaders, body = self.fetch(url, headers)
+        except OSError:
+            if page is None:
+                self.count("missing")
+                raise
+            self.count("cached")
+            return page
+
+        if status == 304 and page is not None:
+            info["fetched"] = time.time()
+            self.save(url, info)
+            self.count("revalidated")
+            return page
+        if status != 200:
+            if page is not None:
+                self.count("cached")
+                return page
+            self.count("missing")
+            return None
+
+        # header names are matched without regard to case
+        responseHeaders = {k.lower(): v for k, v in responseHeaders.items()}
+        self.save(url, {"url": url, "fetched": time.time(), "etag": responseHeaders.get("etag"),
+                        "lastModified": responseHeaders.get("last-modified")}, body)
+        self.count("fetched")
+        return body
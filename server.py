@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: live standings server
+#  Author: Grant Barker
+#
+#  A tiny JSON-over-HTTP server, bound to localhost, that
+#    answers from tallies already in memory:
+#
+#    /rankings                  every ranked coaster
+#    /coaster?name=X            one coaster's numbers
+#    /versus?a=X&b=Y            head-to-head W-L-T of X vs Y
+#
+#  Coasters can be given by full name or abbreviation
+# ==========================================================
+
+import json
+import asyncio
+import threading
+import numpy as np
+from urllib.parse import urlsplit, parse_qs
+
+from matrix import sharedRanks
+
+class Standings:
+
+    # a frozen copy of the tallies, so queries never see a half-applied ballot
+    def __init__(self, winLossMatrix, coasterDict, minRiders, ballotCount):
+        self.matrix = winLossMatrix.copy()
+        self.minRiders = minRiders
+        self.ballotCount = ballotCount
+
+        m = self.matrix
+        self.lookup = {}
+        for i, name in enumerate(m.names):
+            self.lookup[name.lower()] = i
+            self.lookup.setdefault(coasterDict[name].abbr.lower(), i)
+
+        totalContests = m.totalWins + m.totalLosses + m.totalTies
+        self.totalPercentage = np.zeros(m.size)
+        np.divide(m.totalWins + m.totalTies / 2, totalContests, out=self.totalPercentage, where=totalContests > 0)
+        self.totalPercentage *= 100
+
+        self.pairwiseWins, self.pairwiseLosses, self.pairwiseTies = m.calculate()
+        pairContests = self.pairwiseWins + self.pairwiseLosses + self.pairwiseTies
+        self.pairwisePercentage = np.zeros(m.size)
+        np.divide(self.pairwiseWins + self.pairwiseTies / 2, pairContests, out=self.pairwisePercentage, where=pairContests > 0)
+        self.pairwisePercentage *= 100
+
+        # rank eligible coasters by total win percentage, ties sharing a rank
+        self.eligible = m.riders >= minRiders
+        eligible = np.flatnonzero(self.eligible)
+        self.order = eligible[np.argsort(-self.totalPercentage[eligible], kind="stable")]
+        self.rank = np.zeros(m.size, dtype=np.int64)
+        self.rank[self.order] = sharedRanks(self.totalPercentage[self.order])
+
+        self.designers = [coasterDict[name].designer for name in m.names]
+        self.abbrs = [coasterDict[name].abbr for name in m.names]
+
+    def find(self, name):
+        if name is None or name.lower() not in self.lookup:
+            raise KeyError(name)
+        return self.lookup[name.lower()]
+
+    def coaster(self, i):
+        m = self.matrix
+        stats = {
+            "coaster": m.names[i],
+            "abbr": self.abbrs[i],
+            "rank": int(self.rank[i]) if self.eligible[i] else None,
+            "riders": int(m.riders[i]),
+            "totalWinPercentage": float(self.totalPercentage[i]),
+            "totalWins": int(m.totalWins[i]),
+            "totalLosses": int(m.totalLosses[i]),
+            "totalTies": int(m.totalTies[i]),
+        }
+        if m.pairs:
+            stats.update({
+                "pairwiseWinPercentage": float(self.pairwisePercentage[i]),
+                "pairWins": int(self.pairwiseWins[i]),
+                "pairLosses": int(self.pairwiseLosses[i]),
+                "pairTies": int(self.pairwiseTies[i]),
+            })
+        if self.designers[i]:
+            stats["designer"] = self.designers[i]
+        return stats
+
+    def rankings(self):
+        return {
+            "ballots": self.ballotCount,
+            "minRiders": self.minRiders,
+            "rankings": [self.coaster(i) for i in self.order],
+        }
+
+    # one cell of the "Coaster vs Coaster Win-Loss-Tie" sheet
+    def versus(self, a, b):
+        wins, losses, ties = self.matrix.counts(a, b)
+        if wins > losses:
+            result = "W"
+        elif wins < losses:
+            result = "L"
+        else:
+            result = "T"
+        return {
+            "coaster": self.matrix.names[a],
+            "rival": self.matrix.names[b],
+            "wins": wins,
+            "losses": losses,
+            "ties": ties,
+            "result": result,
+            "cell": "{0} {1}-{2}-{3}".format(result, wins, losses, ties),
+        }
+
+
+
+# ==================================================
+#  serve the latest standings over HTTP
+#
+#  the server runs its own event loop on a background
+#    thread; publish() swaps in new standings at once
+# ==================================================
+
+class StandingsServer:
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.host = host
+        self.port = port
+        self.standings = None
+
+    def publish(self, standings):
+        self.standings = standings
+
+    def start(self):
+        started = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+            except OSError as e:
+                failure.append(e)
+                started.set()
+                return
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        if failure:
+            raise failure[0]
+
+    def route(self, method, target):
+        standings = self.standings
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+        if standings is None:
+            return 503, {"error": "no standings yet"}
+
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/rankings":
+                return 200, standings.rankings()
+            elif url.path == "/coaster":
+                return 200, standings.coaster(standings.find(query.get("name")))
+            elif url.path == "/versus":
+                if not standings.matrix.pairs:
+                    return 404, {"error": "pairwise results weren't tallied (--totals-only)"}
+                a = standings.find(query.get("a"))
+                b = standings.find(query.get("b"))
+                if a == b:
+                    return 400, {"error": "can't compare a coaster to itself"}
+                return 200, standings.versus(a, b)
+        except KeyError as e:
+            return 404, {"error": "unknown coaster {0}".format(e)}
+        return 404, {"error": "try /rankings, /coaster?name=X, or /versus?a=X&b=Y"}
+
+    async def handle(self, reader, writer):
+        try:
+            requestLine = (await reader.readline()).decode("latin-1")
+            while (await reader.readline()).strip():
+                pass
+            method, target = requestLine.split()[:2]
+            status, body = self.route(method, target)
+        except ValueError:
+            status, body = 400, {"error": "bad request"}
+
+        data = json.dumps(body).encode("utf-8")
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   503: "Service Unavailable"}
+        writer.write("HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\nConnection: close\r\n\r\n".format(
+            status, reasons[status], len(data)).encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
@@ -15,7 +15,7 @@ class Spinner(object):
 
     def __init__(self):
         self.stop_running = threading.Event()
-        self.spin_thread = threading.Thread(target=self.init_spin)
+        self.spin_thread = threading.Thread(target=self.init_spin, daemon=True)
 
     def start(self):
         self.spin_thread.start()
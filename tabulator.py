@@ -17,9 +17,16 @@ if sys.version_info[0] < 3:
     sys.exit()
 
 import os
+import time
 import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.styles import Font, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.formatting.rule import ColorScaleRule
 from openpyxl.utils import get_column_letter
 
 # nonessential local imports
@@ -35,19 +42,65 @@ try:
 except:
     print('Could not find "coaster.py"; exiting...')
     sys.exit()
-
-# global strings for parsing ballots
-commentStr = "* "
-blankUserField = "-Replace "
-startLine = "! DO NOT CHANGE OR DELETE THIS LINE !"
+try:
+    from matrix import WinLossMatrix, HawkerGrid
+except:
+    print('Could not find "matrix.py"; exiting...')
+    sys.exit()
+try:
+    from ballot import commentStr, startLine, tallyBallots, tallyBallotSlice, tallyBallotData, tallyBallotDataSlice, ballotFileUnchanged
+except:
+    print('Could not find "ballot.py"; exiting...')
+    sys.exit()
+try:
+    from ballotsource import isBallotArchive, scanBallotFolder, readBallotArchive, memberOrder, readMailbox
+except:
+    print('Could not find "ballotsource.py"; exiting...')
+    sys.exit()
+try:
+    from tallyfile import coasterListHash, saveTally, loadTally
+except:
+    print('Could not find "tallyfile.py"; exiting...')
+    sys.exit()
+try:
+    from ballotcache import BallotCache
+except:
+    print('Could not find "ballotcache.py"; exiting...')
+    sys.exit()
+try:
+    from rcdbcache import RCDBCache, PoliteFetcher, fetchURL, folderFetcher
+except:
+    print('Could not find "rcdbcache.py"; exiting...')
+    sys.exit()
+try:
+    from ballotstore import BallotStore, writeStore
+except:
+    print('Could not find "ballotstore.py"; exiting...')
+    sys.exit()
+try:
+    from database import writeDatabase
+except:
+    print('Could not find "database.py"; exiting...')
+    sys.exit()
+try:
+    from server import Standings, StandingsServer
+except:
+    print('Could not find "server.py"; exiting...')
+    sys.exit()
+try:
+    from exporters import exportFormats, exportAvailable, openExporter
+except:
+    print('Could not find "exporters.py"; exiting...')
+    sys.exit()
 
 # command line arguments
+sheetChoices = ["masterlist", "results", "pairs", "cvc", "cvc-pairwin", "comparison"]
 parser = argparse.ArgumentParser(description='Process Mitch Hawker-style coaster poll.')
 
 parser.add_argument("-b", "--blankBallot", default="blankballot2019.txt",
                     help="specify blank ballot file")
 parser.add_argument("-f", "--ballotFolder", default="ballots2019",
-                    help="specify folder containing filled ballots")
+                    help="specify folder (or zip/tar archive) containing filled ballots")
 parser.add_argument("-m", "--minRiders", type=int, default=10,
                     help="specify minimum number of riders for a coaster to rank")
 parser.add_argument("-o", "--outfile", default="Poll Results.xlsx",
@@ -58,8 +111,62 @@ parser.add_argument("-d", "--designset", default="wood",
                     help="specify design/manufacturer dictionary (wood or steel)")
 parser.add_argument("-i", "--includeExtraInfo", action="count", default=0,
                     help="include voter data/misc info; duplicate for more info")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="specify number of worker processes for reading ballots")
 parser.add_argument("-r", "--botherRCDB", action="store_true",
                     help="bother RCDB to grab metadata from links in blankBallot")
+parser.add_argument("-t", "--totals-only", dest="totalsOnly", action="store_true",
+                    help="only rank by total win percentage; skip all pairwise results")
+parser.add_argument("--sheets", nargs="+", choices=sheetChoices, default=sheetChoices, metavar="SHEET",
+                    help="only write these worksheets: {0} (default: all)".format(", ".join(sheetChoices)))
+parser.add_argument("--contested-only", dest="contestedOnly", action="store_true",
+                    help="leave pairs of coasters no voter rode both of out of Ranked Pairs and the pairs export")
+parser.add_argument("--top-pairs", dest="topPairs", type=int, metavar="K",
+                    help="only keep the K best pairs in Ranked Pairs and the pairs export")
+parser.add_argument("--min-contests", dest="minContests", type=int, default=0, metavar="M",
+                    help="only keep pairs that at least M voters rode both of in Ranked Pairs and the pairs export")
+parser.add_argument("--export", nargs="+", choices=exportFormats, default=[], metavar="FORMAT",
+                    help="also write the results, pairs, and coaster stats as {0} files".format("/".join(exportFormats)))
+parser.add_argument("--tabulate-shard", dest="tabulateShard", metavar="SHARDFILE",
+                    help="write a partial tally of the ballots to SHARDFILE instead of results")
+parser.add_argument("--merge", nargs="+", metavar="SHARDFILE",
+                    help="sum partial tallies from SHARDFILEs instead of reading ballotFolder")
+parser.add_argument("--mailbox", metavar="MAILBOX",
+                    help="read ballots attached to the emails in a Maildir folder or mbox file instead of ballotFolder")
+parser.add_argument("--snapshot", metavar="SNAPSHOTFILE",
+                    help="keep tallies in SNAPSHOTFILE and only reread ballots that changed since")
+parser.add_argument("--store", metavar="STOREFILE",
+                    help="read ballots from a memory-mapped store, rebuilding it first if the ballot folder changed")
+parser.add_argument("--database", metavar="DBFILE",
+                    help="also save the coasters, ballots, and tallies to an SQLite database")
+parser.add_argument("--cacheFolder", default=".ballotcache",
+                    help="specify folder for the cache of parsed ballots")
+parser.add_argument("--cacheSize", type=int, default=64,
+                    help="specify maximum size of the parsed ballot cache in MB")
+parser.add_argument("--no-cache", dest="noCache", action="store_true",
+                    help="don't read or write the cache of parsed ballots")
+parser.add_argument("--rcdbCacheFolder", default=".rcdbcache",
+                    help="specify folder for the cache of RCDB pages (with -r)")
+parser.add_argument("--rcdbMaxAge", type=float, default=30,
+                    help="specify days before a cached RCDB page is checked for changes (with -r)")
+parser.add_argument("--rcdbJobs", type=int, default=4,
+                    help="specify number of RCDB pages to fetch at once (with -r)")
+parser.add_argument("--rcdbRate", type=float, default=4.0,
+                    help="specify maximum requests per second to RCDB (with -r)")
+parser.add_argument("--rcdbTimeout", type=float, default=30.0,
+                    help="specify seconds to wait on an RCDB request before retrying (with -r)")
+parser.add_argument("--rcdbRetries", type=int, default=3,
+                    help="specify number of times to retry a failed RCDB request (with -r)")
+parser.add_argument("--rcdbFixtures", metavar="DIR",
+                    help="read RCDB pages from saved copies in DIR (e.g. 320.htm) instead of rcdb.com (with -r)")
+parser.add_argument("--offline", action="store_true",
+                    help="only use cached RCDB pages, never the network (with -r)")
+parser.add_argument("--watch", action="store_true",
+                    help="keep running and update the results as ballots are added, changed, or removed")
+parser.add_argument("--debounce", type=float, default=5.0,
+                    help="specify seconds without ballot changes to wait before rewriting results in --watch mode")
+parser.add_argument("--serve", type=int, metavar="PORT",
+                    help="answer ranking and head-to-head queries as JSON on localhost:PORT until stopped")
 parser.add_argument("-v", "--verbose", action="count", default=0,
                     help="print data as it's processed; duplicate for more info")
 
@@ -69,7 +176,23 @@ if not os.path.isfile(args.blankBallot):
     print('Blank ballot source "{0}" is not a file; exiting...'.format(args.blankBallot))
     sys.exit()
 
-if not os.path.isdir(args.ballotFolder) or len(os.listdir(args.ballotFolder)) < 1:
+if args.merge:
+    for shard in args.merge:
+        if not os.path.isfile(shard):
+            print('Shard "{0}" is not a file; exiting...'.format(shard))
+            sys.exit()
+elif args.mailbox:
+    if not os.path.exists(args.mailbox):
+        print('Mailbox "{0}" does not exist; exiting...'.format(args.mailbox))
+        sys.exit()
+    if args.watch or args.store:
+        print("--watch and --store need a ballot folder, not a mailbox; exiting...")
+        sys.exit()
+elif isBallotArchive(args.ballotFolder):
+    if args.watch or args.snapshot or args.store:
+        print("--watch, --snapshot, and --store need a ballot folder, not an archive; exiting...")
+        sys.exit()
+elif not os.path.isdir(args.ballotFolder) or len(os.listdir(args.ballotFolder)) < 1:
     print('Ballot folder "{0}" does not exist or is empty; exiting...'.format(args.ballotFolder))
     sys.exit()
 
@@ -90,6 +213,39 @@ else:
     print("Wood and steel are the only valid design/manufacturer dictionaries; exiting...")
     sys.exit()
 
+if args.watch and (args.merge or args.tabulateShard):
+    print("--watch only works when reading a ballot folder; exiting...")
+    sys.exit()
+
+if args.store and (args.merge or args.snapshot):
+    print("--store can't be combined with --merge or --snapshot; exiting...")
+    sys.exit()
+
+for exportFormat in args.export:
+    if not exportAvailable(exportFormat):
+        print("Exporting {0} requires pyarrow; exiting...".format(exportFormat))
+        sys.exit()
+
+if args.topPairs is not None and args.topPairs < 1:
+    print("--top-pairs needs at least 1 pair; exiting...")
+    sys.exit()
+
+if args.totalsOnly and not ("masterlist" in args.sheets or "results" in args.sheets):
+    print("--totals-only leaves none of the worksheets picked with --sheets to write; exiting...")
+    sys.exit()
+
+if args.rcdbFixtures and not os.path.isdir(args.rcdbFixtures):
+    print('RCDB fixture folder "{0}" is not a folder; exiting...'.format(args.rcdbFixtures))
+    sys.exit()
+
+if args.serve is not None and args.tabulateShard:
+    print("--serve can't be used when tabulating a shard; exiting...")
+    sys.exit()
+
+# shards only need coaster names; RCDB data is fetched when they're merged
+if args.tabulateShard:
+    args.botherRCDB = False
+
 # colorizing coasters by designer requires fetching RCDB data
 if args.colorize and not args.botherRCDB:
     args.colorize = False
@@ -101,46 +257,119 @@ if args.colorize and not args.botherRCDB:
 # ==================================================
 
 def main():
-    # create Excel workbook
-    xlout = Workbook()
-    xlout.active.title = "Coaster Masterlist"
+    # with -j, the ballot workers are started before anything else
+    startTallyPool()
 
-    # preferred fixed-width font
-    menlo = Font(name="Menlo")
+    # dictionary of every coaster on the ballot, keyed by full coaster name
+    coasterDict, rcdbLinks = getCoasterDict()
+
+    # RCDB is slow, so it's read while the ballots are tallied and the results are
+    #   calculated (shards never use its details)
+    rcdbDetails = None
+    if args.botherRCDB and not args.tabulateShard:
+        rcdbDetails = startRCDBDetails(rcdbLinks)
+
+    # for each pair of coasters, their wins, losses, ties, and win percentage
+    winLossMatrix = createMatrix(coasterDict)
+
+    # claim the port up front, so a busy one doesn't waste a whole tabulation
+    server = None
+    if args.serve is not None:
+        server = StandingsServer(args.serve)
+        try:
+            server.start()
+        except OSError as e:
+            print("Could not serve on port {0}: {1}; exiting...".format(args.serve, e.strerror))
+            sys.exit()
+
+    # read and tally the ballot folder, or sum the tallies of earlier shards
+    if args.merge:
+        ballots = mergeShards(winLossMatrix)
+    elif args.mailbox:
+        ballots = importMailbox(winLossMatrix)
+    elif args.snapshot:
+        ballots = updateSnapshot(winLossMatrix)
+    elif args.store:
+        ballots = updateStore(winLossMatrix)
+    elif os.path.isfile(args.ballotFolder):
+        ballots = tallyArchiveBallots(winLossMatrix)
+    else:
+        ballots = tallyAllBallots(getBallotFilepaths(), winLossMatrix)
+
+    # a shard stops here and leaves the results to whoever merges it
+    if args.tabulateShard:
+        for ballot in ballots:
+            reportBallot(ballot)
+        writeShard(winLossMatrix, ballots)
+        return
+
+    writeResults(coasterDict, winLossMatrix, ballots, rcdbDetails)
+    if args.database:
+        saveDatabase(coasterDict, winLossMatrix, ballots)
+
+    if server:
+        publishStandings(server, coasterDict, winLossMatrix, ballots)
+        print("Serving standings at http://127.0.0.1:{0}/rankings; press Ctrl+C to stop.".format(args.serve))
+
+    # keep the results up to date as ballots arrive
+    if args.watch:
+        watchBallots(coasterDict, winLossMatrix, ballots, server)
+    elif server:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("\nStopped serving.")
+
+
+
+# ==================================================
+#  turn the tallies into a results spreadsheet
+# ==================================================
+
+def writeResults(coasterDict, winLossMatrix, ballots, rcdbDetails=None, reportPaths=None):
+    # create Excel workbook; its write-only worksheets stream each row to disk as
+    #   it's appended, so column widths and frozen panes are set before any rows
+    xlout = Workbook(write_only=True)
 
-    # list of tuples of the form (fullCoasterName, abbreviatedCoasterName)
-    coasterDict = getCoasterDict(xlout.active, menlo)
+    # preferred fixed-width font, and the named styles shared by every sheet
+    menlo = Font(name="Menlo")
+    namedStyles = createNamedStyles(xlout, menlo)
 
     # create color key for designers
     if args.colorize:
         coasterdesignerws = xlout.create_sheet("Coaster Designer Color Key")
-        i = 1
+        coasterdesignerws.column_dimensions['A'].width = 30.83
         for designer in sorted(designers.keys()):
             if designer != "" and designer != "Other Known Manufacturer":
-                coasterdesignerws.append([designer])
-                coasterdesignerws.cell(row=i, column=1).fill = designers[designer]
-                i += 1
+                coasterdesignerws.append(styleColumns(coasterdesignerws, [designer], [1], style=namedStyles[designer]))
         if "Other Known Manufacturer" in designers.keys():
-            coasterdesignerws.append(["Other Known Manufacturer"])
-            coasterdesignerws.cell(row=i, column=1).fill = designers["Other Known Manufacturer"]
-            i += 1
+            coasterdesignerws.append(styleColumns(coasterdesignerws, ["Other Known Manufacturer"], [1],
+                                                  style=namedStyles["Other Known Manufacturer"]))
         if "" in designers.keys():
-            coasterdesignerws.append(["Other [Unknown]"])
-            coasterdesignerws.cell(row=i, column=1).fill = designers[""]
-        coasterdesignerws.column_dimensions['A'].width = 30.83
+            coasterdesignerws.append(styleColumns(coasterdesignerws, ["Other [Unknown]"], [1], style=namedStyles[""]))
 
-    # for each pair of coasters, a list of numbers of the form [wins, losses, ties, winPercent]
-    winLossMatrix = createMatrix(coasterDict)
-
-    processAllBallots(xlout, coasterDict, winLossMatrix)
+    processAllBallots(xlout, coasterDict, winLossMatrix, ballots, reportPaths)
 
     calculateResults(coasterDict, winLossMatrix)
 
     # sorted lists of tuples of the form (rankedCoaster, relevantNumbers)
-    finalResults, finalPairs = sortedLists(coasterDict, winLossMatrix)
+    finalResults, finalPairs, hawkerGrid = sortedLists(coasterDict, winLossMatrix)
+
+    # everything from here on shows designers and years, so RCDB has to be done by now
+    if rcdbDetails:
+        finishRCDBDetails(*rcdbDetails)
+
+    # written last, but still the first worksheet
+    if "masterlist" in args.sheets:
+        writeMasterlist(xlout.create_sheet("Coaster Masterlist", 0), coasterDict, menlo, namedStyles)
+
+    # the plain exports are quick, so they're out before the workbook
+    for exportFormat in args.export:
+        exportResults(exportFormat, finalResults, finalPairs, winLossMatrix, coasterDict)
 
     # write worksheets related to finalResults, finalPairs, and winLossMatrix
-    printToFile(xlout, finalResults, finalPairs, winLossMatrix, coasterDict, menlo, designers)
+    printToFile(xlout, finalResults, finalPairs, hawkerGrid, winLossMatrix, coasterDict, menlo, namedStyles)
 
     # save the Excel file
     print("Saving...", end=" ")
@@ -155,21 +384,64 @@ def main():
 
 
 # ==================================================
-#  function for getting manufacturer's color
+#  register the styles used all over the workbook
+#
+#  a named style is added to the workbook once, and
+#    cells then just point at it, rather than each
+#    one adding its own font or fill; designer colors
+#    are keyed by designer, like wood.designers
+#
+#  anything a style doesn't change is left at the
+#    workbook's defaults, so cells look just the same
 # ==================================================
 
-def colorizeRow(worksheet, rowNum, colList, coasterDict, coaster, colorDict):
+def createNamedStyles(xl, preferredFixedWidthFont):
+    namedStyles = {"Fixed Width": NamedStyle("Fixed Width", font=preferredFixedWidthFont, border=DEFAULT_BORDER)}
+    if args.colorize:
+        for designer, fill in designers.items():
+            namedStyles[designer] = NamedStyle("Designer: {0}".format(designer or "Other [Unknown]"),
+                                               font=DEFAULT_FONT, fill=fill, border=DEFAULT_BORDER)
+    # cells refer to their style by name, which openpyxl looks up far faster
+    for key, style in namedStyles.items():
+        xl.add_named_style(style)
+        namedStyles[key] = style.name
+    return namedStyles
+
+
+
+# ==================================================
+#  functions for styling a row before it's appended
+#
+#  rowVals is the list of values about to be appended;
+#    styled columns are swapped for write-only cells
+#    (a named style replaces any earlier styling)
+# ==================================================
+
+def styleColumns(worksheet, rowVals, colList, font=None, fill=None, style=None):
+    for l in colList:
+        while len(rowVals) < l:
+            rowVals.append(None)
+        if not isinstance(rowVals[l-1], Cell):
+            rowVals[l-1] = WriteOnlyCell(worksheet, value=rowVals[l-1])
+        if style:
+            rowVals[l-1].style = style
+        if font:
+            rowVals[l-1].font = font
+        if fill:
+            rowVals[l-1].fill = fill
+    return rowVals
+
+# fill the given columns with the color of the coaster's manufacturer
+def colorizeRow(worksheet, rowVals, colList, coasterDict, coaster, namedStyles):
     if args.colorize:
         if coasterDict[coaster].designer:
-            if coasterDict[coaster].designer in colorDict.keys():
-                for l in colList:
-                    worksheet.cell(row=rowNum, column=l).fill = colorDict[coasterDict[coaster].designer]
+            if coasterDict[coaster].designer in designers.keys():
+                styleColumns(worksheet, rowVals, colList, style=namedStyles[coasterDict[coaster].designer])
             else:
-                for l in colList:
-                    worksheet.cell(row=rowNum, column=l).fill = colorDict["Other Known Manufacturer"]
+                styleColumns(worksheet, rowVals, colList, style=namedStyles["Other Known Manufacturer"])
         else:
-            for l in colList:
-                    worksheet.cell(row=rowNum, column=l).fill = colorDict[""]
+            styleColumns(worksheet, rowVals, colList, style=namedStyles[""])
+    return rowVals
 
 
 
@@ -177,31 +449,14 @@ def colorizeRow(worksheet, rowNum, colList, coasterDict, coaster, colorDict):
 #  populate dictionary of coasters in the poll
 # ==================================================
 
-def getCoasterDict(masterlistws, preferredFixedWidthFont):
-    if not args.botherRCDB:
-        print("Creating list of every coaster on the ballot...", end=" ")
-        if useSpinner:
-            spinner = Spinner()
-            spinner.start()
-
-    # set up Coaster Masterlist worksheet
-    headerRow = ["Full Coaster ID", "Abbrev.", "Name", "Park", "Loc."]
-    if args.botherRCDB:
-        headerRow.extend(["RCDB Link", "Designer/Manufacturer", "Year"])
-    masterlistws.append(headerRow)
-    masterlistws.column_dimensions['A'].width = 45.83
-    masterlistws.column_dimensions['B'].width = 12.83
-    masterlistws.column_dimensions['C'].width = 25.83
-    masterlistws.column_dimensions['D'].width = 25.83
-    masterlistws.column_dimensions['E'].width = 6.83
-    masterlistws['B1'].font = preferredFixedWidthFont
-    masterlistws['E1'].font = preferredFixedWidthFont
-    if args.botherRCDB:
-        masterlistws.column_dimensions['F'].width = 16.83
-        masterlistws.column_dimensions['G'].width = 25.83
-        masterlistws.column_dimensions['H'].width = 4.83
+def getCoasterDict():
+    print("Creating list of every coaster on the ballot...", end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
 
     coasterDict = {} # return value
+    rcdbLinks = [] # (coaster, RCDB link) for each coaster with one, in ballot order
 
     #open the blank ballot file
     with open(args.blankBallot) as f:
@@ -218,7 +473,7 @@ def getCoasterDict(masterlistws, preferredFixedWidthFont):
             if startProcessing == False and sline == startLine:
                 startProcessing = True
 
-            # add the coasters to coasterDict and the masterlist worksheet
+            # add the coasters to coasterDict
             elif startProcessing == True:
 
                 if commentStr in sline: # skip comment lines (begin with "* ")
@@ -236,37 +491,102 @@ def getCoasterDict(masterlistws, preferredFixedWidthFont):
                         print("Error in {0}, Line {1}: {2}".format(args.blankBallot, lineNum, line))
 
                     else:
-                        if len(words) > 3 and args.botherRCDB:
-                            c = Coaster(words[1], words[2], words[3], designers.keys())
-                        else:
-                            c = Coaster(words[1], words[2])
-
-                        # list of strings that will form a row in the spreadsheet
-                        rowVals = [c.uniqueID, c.abbr, c.name, c.park, c.location]
-
-                        # add RCDB-pulled info to spreadsheet row and print it
-                        if len(words) > 3 and args.botherRCDB:
-                            rowVals.append('=HYPERLINK("{0}", "{1}")'.format(c.rcdb, c.rcdb[8:]))
-                            rowVals.extend([c.designer, c.year])
-                            print("{0},   \t{1},\t{2}".format(c.abbr, c.year, c.designer))
-
-                        # append the row values and set styles
-                        masterlistws.append(rowVals)
-                        masterlistws.cell(row=len(coasterDict)+1, column=5).font = preferredFixedWidthFont
-                        masterlistws.cell(row=len(coasterDict)+1, column=2).font = preferredFixedWidthFont
-                        if c.rcdb:
-                            masterlistws.cell(row=len(coasterDict)+1, column=6).style = "Hyperlink"
+                        c = Coaster(words[1], words[2])
+                        if len(words) > 3:
+                            rcdbLinks.append((c, words[3]))
 
                         # add the coaster to the dictionary of coasters on the ballot
                         coasterDict[c.uniqueID] = c
 
-                        colorizeRow(masterlistws, len(coasterDict)+1, [1,2,7], coasterDict, c.uniqueID, designers)
-
-    masterlistws.freeze_panes = masterlistws['A2']
-    if useSpinner and not args.botherRCDB:
+    if useSpinner:
         spinner.stop()
     print("{0} coasters on the ballot.".format(len(coasterDict)))
-    return coasterDict
+    return coasterDict, rcdbLinks
+
+
+
+# ==================================================
+#  fill in coasters' designers and years from RCDB
+#
+#  they aren't needed until the results are written,
+#    so pages are fetched and read by a pool of
+#    threads in the background while the ballots are
+#    tallied, and only waited on before any output
+# ==================================================
+
+def startRCDBDetails(rcdbLinks):
+    print("Fetching RCDB details for {0} coasters in the background...".format(len(rcdbLinks)))
+    if args.rcdbFixtures:
+        fetch = folderFetcher(args.rcdbFixtures)
+    else:
+        fetch = PoliteFetcher(partial(fetchURL, timeout=args.rcdbTimeout), args.rcdbRate, args.rcdbRetries)
+    rcdbCache = RCDBCache(args.rcdbCacheFolder, args.rcdbMaxAge * 24 * 60 * 60, args.offline, fetch)
+    pool = ThreadPoolExecutor(max_workers=max(1, args.rcdbJobs))
+    futures = [pool.submit(readRCDBDetails, c, link, rcdbCache) for c, link in rcdbLinks]
+    pool.shutdown(wait=False)
+    return rcdbCache, rcdbLinks, futures
+
+# returns why the page couldn't be read, if it couldn't; the coaster is then left
+#   without RCDB details rather than stopping the run
+def readRCDBDetails(c, link, rcdbCache):
+    try:
+        c.readRCDB(link, designers.keys(), rcdbCache.get)
+    except Exception as e:
+        return "Could not read {0} for {1}: {2}".format(link, c.abbr, e)
+    return None
+
+# wait for the RCDB details, then report them in ballot order
+def finishRCDBDetails(rcdbCache, rcdbLinks, futures):
+    if not all(future.done() for future in futures):
+        print("Waiting on RCDB...")
+    for (c, link), future in zip(rcdbLinks, futures):
+        error = future.result()
+        if error:
+            print(error)
+        print("{0},   \t{1},\t{2}".format(c.abbr, c.year, c.designer))
+    print("RCDB pages: {0} cached, {1} revalidated, {2} fetched, {3} unavailable.".format(
+          rcdbCache.cached, rcdbCache.revalidated, rcdbCache.fetched, rcdbCache.missing))
+
+
+
+# ==================================================
+#  write the Coaster Masterlist worksheet
+# ==================================================
+
+def writeMasterlist(masterlistws, coasterDict, preferredFixedWidthFont, namedStyles):
+    # set up Coaster Masterlist worksheet
+    headerRow = ["Full Coaster ID", "Abbrev.", "Name", "Park", "Loc."]
+    if args.botherRCDB:
+        headerRow.extend(["RCDB Link", "Designer/Manufacturer", "Year"])
+    masterlistws.column_dimensions['A'].width = 45.83
+    masterlistws.column_dimensions['B'].width = 12.83
+    masterlistws.column_dimensions['C'].width = 25.83
+    masterlistws.column_dimensions['D'].width = 25.83
+    masterlistws.column_dimensions['E'].width = 6.83
+    if args.botherRCDB:
+        masterlistws.column_dimensions['F'].width = 16.83
+        masterlistws.column_dimensions['G'].width = 25.83
+        masterlistws.column_dimensions['H'].width = 4.83
+    masterlistws.freeze_panes = 'A2'
+    masterlistws.append(styleColumns(masterlistws, headerRow, [2,5], style=namedStyles["Fixed Width"]))
+
+    for c in coasterDict.values():
+        # list of strings that will form a row in the spreadsheet
+        rowVals = [c.uniqueID, c.abbr, c.name, c.park, c.location]
+
+        # add RCDB-pulled info to spreadsheet row
+        if c.rcdb:
+            rowVals.append('=HYPERLINK("{0}", "{1}")'.format(c.rcdb, c.rcdb[8:]))
+            rowVals.extend([c.designer, c.year])
+
+        # set styles and append the row values; a colored abbreviation gets the font on top
+        styleColumns(masterlistws, rowVals, [2,5], style=namedStyles["Fixed Width"])
+        if c.rcdb:
+            styleColumns(masterlistws, rowVals, [6], style="Hyperlink")
+        colorizeRow(masterlistws, rowVals, [1,2,7], coasterDict, c.uniqueID, namedStyles)
+        if args.colorize:
+            styleColumns(masterlistws, rowVals, [2], font=preferredFixedWidthFont)
+        masterlistws.append(rowVals)
 
 
 
@@ -280,16 +600,16 @@ def getBallotFilepaths():
         spinner = Spinner()
         spinner.start()
 
-    ballotList = []
-    for file in os.listdir(args.ballotFolder):
-        if file.endswith(".txt"):
-            ballotList.append(os.path.join(args.ballotFolder, file))
+    ballotList = listBallotFilepaths()
 
     if useSpinner:
         spinner.stop()
     print("{0} ballots submitted.".format(len(ballotList)))
     return ballotList
 
+def listBallotFilepaths():
+    return scanBallotFolder(args.ballotFolder)
+
 
 
 # ==================================================
@@ -297,23 +617,16 @@ def getBallotFilepaths():
 # ==================================================
 
 def createMatrix(coasterDict):
+    if args.totalsOnly:
+        print("Skipping the win/loss matrix; tallying totals only.")
+        return WinLossMatrix(coasterDict.keys(), pairs=False)
+
     print("Creating the win/loss matrix...", end=" ")
     if useSpinner:
         spinner = Spinner()
         spinner.start()
 
-    winLossMatrix = {}
-    for coasterA in coasterDict.keys():
-        for coasterB in coasterDict.keys():
-
-            # can't compare a coaster to itself
-            if coasterA != coasterB:
-                winLossMatrix[coasterA, coasterB] = {}
-                winLossMatrix[coasterA, coasterB]["Wins"] = 0
-                winLossMatrix[coasterA, coasterB]["Losses"] = 0
-                winLossMatrix[coasterA, coasterB]["Ties"] = 0
-                winLossMatrix[coasterA, coasterB]["Win Percentage"] = 0.0
-                winLossMatrix[coasterA, coasterB]["Pairwise Rank"] = 0
+    winLossMatrix = WinLossMatrix(coasterDict.keys())
 
     if useSpinner:
         spinner.stop()
@@ -323,133 +636,489 @@ def createMatrix(coasterDict):
 
 
 # ================================================================
-#  read a ballot (just ONE ballot)
+#  report on a ballot (just ONE ballot) once it has been read
 #
-#  you need a loop to call this function for each ballot filename
+#  you need a loop to call this function for each ballot
 # ================================================================
 
-def processBallot(filepath, coasterDict, winLossMatrix):
-    filename = os.path.basename(filepath)
+def reportBallot(ballot):
     if args.verbose > 0:
-        print("Processing ballot: {0}".format(filename))
+        print("Processing ballot: {0}".format(ballot.filename))
 
-    voterInfo = [filename, "", "", "", "", ""] # return item 1
-    coasterAndRank = {} # return item 2
-    creditNum = 0
-    error = False
+    for message in ballot.messages:
+        if args.verbose == 0:
+            print("Processing ballot: {0}".format(ballot.filename))
+        print(message)
 
-    # open the ballot file
-    with open(filepath) as f:
-        infoField = 1
-        lineNum = 0
-        startProcessing = False
+    # the ballot wasn't tallied if there were any errors, don't return voter info
+    if ballot.error:
+        if args.verbose == 0:
+            print("Processing ballot: {0}".format(ballot.filename))
+        print("Error encountered. File {0} not added.".format(ballot.filename))
+        return []
 
-        for line in f:
-            sline = line.strip()
-            lineNum += 1
+    if args.verbose > 0:
+        print(" ->", end=" ")
 
-            # begin at top of ballot and get the voter's info first
-            if startProcessing == False and infoField <= 5 and not commentStr in sline and len(sline) != 0:
+        for i in range(1,len(ballot.voterInfo)):
+            if ballot.voterInfo[i] != "":
+                print("{0},".format(ballot.voterInfo[i]), end=" ")
 
-                # if the line begins with "-Replace" then record a non-answer
-                if blankUserField in sline:
-                    voterInfo[infoField] = ""
-                    infoField += 1
-                elif not startLine in sline:
-                    voterInfo[infoField] = sline.strip('-').strip()
-                    infoField += 1
+        print("CC: {0}".format(ballot.creditNum))
 
-            # skip down the file to the coasters
-            if startProcessing == False and sline == startLine:
-                startProcessing = True
+    return ballotVoterInfo(ballot)
 
-            elif startProcessing == True:
+# the voter info of a ballot, without reporting on it; none if it wasn't tallied
+def ballotVoterInfo(ballot):
+    if ballot.error:
+        return []
+    return ballot.voterInfo + [ballot.creditNum]
 
-                # break the line into its components: rank, name
-                words = [x.strip() for x in sline.split(',')]
 
-                if commentStr in sline: # skip comment lines (begin with "* ")
-                    continue
 
-                elif sline == "": # skip blank lines
-                    continue
+# ==================================================
+#  start the worker processes that tally ballots with -j
+#
+#  they're forked before any other thread (a spinner,
+#    the RCDB fetches, the server) exists: a fork only
+#    copies the thread doing it, so a lock any other
+#    thread held would stay locked forever in the
+#    workers; the same workers then serve the whole
+#    run, including every poll in --watch mode
+# ==================================================
 
-                # make sure there are at least 2 'words' in each line
-                elif len(words) < 2:
-                    if args.verbose == 0:
-                        print("Processing ballot: {0}".format(filename))
-                    print("Error in {0}, Line {1}: {2}".format(args.blankBallot, lineNum, line))
+tallyPool = None
 
-                # make sure the ranking is a number
-                elif not words[0].isdigit():
-                    if args.verbose == 0:
-                        print("Processing ballot: {0}".format(filename))
-                    print("Error in reading {0}, Line {1}: Rank must be an int.".format(filename, lineNum))
-                    error = True
+def startTallyPool():
+    global tallyPool
+    if args.jobs > 1 and not args.merge and not args.mailbox:
+        tallyPool = ProcessPoolExecutor(max_workers=args.jobs)
 
-                else:
-                    coasterName = words[1]
-                    coasterRank = int(words[0])
+        # the first task starts the workers (with fork, all of them at once)
+        tallyPool.submit(int).result()
 
-                    # skip coasters ranked zero or less (those weren't ridden)
-                    if coasterRank <= 0:
-                        continue
 
-                    # check to make sure the coaster on the ballot is legit
-                    if coasterName  in coasterDict.keys():
-                        creditNum += 1
-                        coasterDict[coasterName].riders += 1
 
-                        # add this voter's ranking of the coaster
-                        coasterAndRank[coasterName] = coasterRank
+# ==================================================
+#  read and tally every ballot, in parallel if requested
+#
+#  each worker tallies a slice of the ballots into its
+#    own partial matrix, which are summed at the end;
+#    ballots come back in filepath order either way
+# ==================================================
 
-                    else: # it's not a legit coaster!
-                        if args.verbose == 0:
-                            print("Processing ballot: {0}".format(filename))
-                        print("Error in reading {0}, Line {1}: Unknown coaster {2}".format(filename, lineNum, coasterName))
-                        error = True
+def tallyAllBallots(filepaths, winLossMatrix):
+    # no ballots, so no cache to open or trim
+    if not filepaths:
+        return []
 
-    # don't tally the ballot if there were any errors, don't return voter info
-    if error:
-        if args.verbose == 0:
-            print("Processing ballot: {0}".format(filename))
-        print("Error encountered. File {0} not added.".format(filename))
-        return [], {}
+    cache = None
+    if not args.noCache:
+        cache = BallotCache(args.cacheFolder, winLossMatrix.names, args.cacheSize * 1024 * 1024)
 
-    # cycle through each pair of coasters this voter ranked
-    for coasterA in coasterAndRank.keys():
-        for coasterB in coasterAndRank.keys():
+    if tallyPool is None or len(filepaths) < 2:
+        ballots = tallyBallots(filepaths, winLossMatrix, cache)
+        if cache is not None:
+            cache.trim()
+        return ballots
 
-            # can't compare a coaster to itself
-            if coasterA != coasterB:
+    # a few slices per worker keeps them all busy if some ballots are longer than others
+    sliceSize = max(1, -(-len(filepaths) // (args.jobs * 4)))
+    slices = [filepaths[i:i+sliceSize] for i in range(0, len(filepaths), sliceSize)]
 
-                # if the coasters have the same ranking, call it a tie
-                if coasterAndRank[coasterA] == coasterAndRank[coasterB]:
-                    winLossMatrix[coasterA, coasterB]["Ties"] += 1
-                    coasterDict[coasterA].totalTies += 1
+    ballots = []
+    partials = tallyPool.map(tallyBallotSlice, slices, [winLossMatrix.names] * len(slices),
+                             [winLossMatrix.pairs] * len(slices), [cache] * len(slices))
+    for partialMatrix, partialBallots in partials:
+        winLossMatrix.merge(partialMatrix)
+        ballots.extend(partialBallots)
+    if cache is not None:
+        cache.trim()
+    return ballots
 
-                # if coasterA outranks coasterB (the rank's number is lower), call it a win for coasterA
-                elif coasterAndRank[coasterA] < coasterAndRank[coasterB]:
-                    winLossMatrix[coasterA, coasterB]["Wins"] += 1
-                    coasterDict[coasterA].totalWins += 1
 
-                # if not a tie nor a win, it must be a loss
-                else:
-                    winLossMatrix[coasterA, coasterB]["Losses"] += 1
-                    coasterDict[coasterA].totalLosses += 1
 
-    if args.verbose > 0:
-        print(" ->", end=" ")
+# ==================================================
+#  read and tally every ballot in an archive
+#
+#  members are streamed out of the archive exactly
+#    once; with -j, batches of them go to the workers
+#    while the rest of the archive is still being read
+# ==================================================
 
-        for i in range(1,len(voterInfo)):
-            if voterInfo[i] != "":
-                print("{0},".format(voterInfo[i]), end=" ")
+def tallyArchiveBallots(winLossMatrix):
+    print('Reading ballots from "{0}"...'.format(args.ballotFolder), end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
 
-        print("CC: {0}".format(creditNum))
+    cache = None
+    if not args.noCache:
+        cache = BallotCache(args.cacheFolder, winLossMatrix.names, args.cacheSize * 1024 * 1024)
 
-    voterInfo.append(creditNum)
+    members = ((os.path.join(args.ballotFolder, name), data) for name, data in readBallotArchive(args.ballotFolder))
+    try:
+        if tallyPool is None:
+            ballots = tallyBallotData(members, winLossMatrix, cache)
+        else:
+            ballots = []
+            futures = []
+            batch = []
+            for member in members:
+                batch.append(member)
+                if len(batch) == 64:
+                    futures.append(tallyPool.submit(tallyBallotDataSlice, batch, winLossMatrix.names, winLossMatrix.pairs, cache))
+                    batch = []
+            if batch:
+                futures.append(tallyPool.submit(tallyBallotDataSlice, batch, winLossMatrix.names, winLossMatrix.pairs, cache))
+            for future in futures:
+                partialMatrix, partialBallots = future.result()
+                winLossMatrix.merge(partialMatrix)
+                ballots.extend(partialBallots)
+    except Exception as e:
+        if useSpinner:
+            spinner.stop()
+        print('\nCould not read archive "{0}": {1}; exiting...'.format(args.ballotFolder, e))
+        sys.exit()
+    if cache is not None:
+        cache.trim()
+
+    # same order as if the archive had been extracted to a folder
+    ballots.sort(key=lambda ballot: memberOrder(os.path.relpath(ballot.path, args.ballotFolder)))
 
-    return voterInfo, coasterAndRank
+    if useSpinner:
+        spinner.stop()
+    print("{0} ballots submitted.".format(len(ballots)))
+    return ballots
+
+
+
+# ==================================================
+#  read and tally the ballots emailed to a mailbox
+#
+#  messages are recognized by their Message-ID, so a
+#    message is never tallied twice; with a snapshot,
+#    importing an updated mailbox only reads the new
+#    messages
+# ==================================================
+
+def importMailbox(winLossMatrix):
+    ballots = []
+    seen = set()
+    if args.snapshot and os.path.isfile(args.snapshot):
+        try:
+            snapshotMatrix, snapshotBallots, header = loadTally(args.snapshot)
+            if header["coasterHash"] != coasterListHash(winLossMatrix.names):
+                raise ValueError("it was built from a different blank ballot")
+            if header["pairs"] != winLossMatrix.pairs:
+                raise ValueError("it was built with a different --totals-only setting")
+            if "messageIDs" not in header["extra"]:
+                raise ValueError("it wasn't imported from a mailbox")
+            winLossMatrix.merge(snapshotMatrix)
+            ballots = snapshotBallots
+            seen = set(header["extra"]["messageIDs"])
+        except Exception as e:
+            print('Ignoring snapshot "{0}": {1}.'.format(args.snapshot, e))
+
+    print('Reading ballots from mailbox "{0}"...'.format(args.mailbox), end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    cache = None
+    if not args.noCache:
+        cache = BallotCache(args.cacheFolder, winLossMatrix.names, args.cacheSize * 1024 * 1024)
+
+    newMessages = 0
+    newBallots = 0
+    try:
+        for messageID, attachments in readMailbox(args.mailbox):
+            if messageID in seen:
+                continue
+            seen.add(messageID)
+            newMessages += 1
+
+            members = [(os.path.join(args.mailbox, messageID, name), data) for name, data in attachments]
+            newBallots += len(members)
+            ballots.extend(tallyBallotData(members, winLossMatrix, cache))
+    except Exception as e:
+        if useSpinner:
+            spinner.stop()
+        print('\nCould not read mailbox "{0}": {1}; exiting...'.format(args.mailbox, e))
+        sys.exit()
+    if cache is not None:
+        cache.trim()
+
+    if args.snapshot:
+        saveTally(args.snapshot, winLossMatrix, ballots, extra={"messageIDs": sorted(seen)})
+
+    if useSpinner:
+        spinner.stop()
+    print("{0} new messages with {1} ballots; {2} ballots in all.".format(newMessages, newBallots, len(ballots)))
+    return ballots
+
+
+
+# ==================================================
+#  write/merge partial tallies ("shards")
+#
+#  shards only hold counts, so they can be merged in
+#    any order or grouping and give the same totals
+# ==================================================
+
+def writeShard(winLossMatrix, ballots):
+    print("Writing the partial tally...", end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    saveTally(args.tabulateShard, winLossMatrix, ballots)
+
+    if useSpinner:
+        spinner.stop()
+    print('{0} ballots saved to "{1}".'.format(len(ballots), args.tabulateShard))
+
+def mergeShards(winLossMatrix):
+    print("Merging partial tallies...", end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    expectedHash = coasterListHash(winLossMatrix.names)
+    ballots = []
+    for shard in args.merge:
+        try:
+            partialMatrix, partialBallots, header = loadTally(shard)
+            if header["coasterHash"] != expectedHash:
+                raise ValueError("it was built from a different blank ballot than {0}".format(args.blankBallot))
+            winLossMatrix.merge(partialMatrix)
+        except Exception as e:
+            if useSpinner:
+                spinner.stop()
+            print('\nCould not merge shard "{0}": {1}; exiting...'.format(shard, e))
+            sys.exit()
+        ballots.extend(partialBallots)
+
+    if useSpinner:
+        spinner.stop()
+    print("{0} ballots from {1} shards.".format(len(ballots), len(args.merge)))
+    return ballots
+
+
+
+# ==================================================
+#  bring already-read ballots up to date with the
+#    ballot folder
+#
+#  only ballots that were added or changed are read,
+#    and the old versions of changed or removed ones
+#    are taken back out of the matrix; the paths that
+#    were read come back with the ballots
+# ==================================================
+
+def syncBallots(winLossMatrix, knownBallots, filepaths):
+    previous = {ballot.path: ballot for ballot in knownBallots}
+
+    # sort the ballot folder into ballots that can be kept and ones that must be read
+    kept = {}
+    toRead = []
+    changed = 0
+    for filepath in filepaths:
+        ballot = previous.pop(filepath, None)
+        try:
+            unchanged = ballot is not None and ballotFileUnchanged(ballot, filepath)
+        except OSError:
+            unchanged = False
+        if unchanged:
+            kept[filepath] = ballot
+        else:
+            toRead.append(filepath)
+            if ballot is not None:
+                previous[filepath] = ballot
+                changed += 1
+
+    # nothing added, changed, or removed; most polls in --watch mode end here
+    if not toRead and not previous:
+        return [kept[filepath] for filepath in filepaths], (0, 0, 0), []
+
+    # take back the old version of every changed or removed ballot
+    for ballot in previous.values():
+        if not ballot.error:
+            winLossMatrix.removeBallot(ballot.indices, ballot.ranks)
+
+    for ballot in tallyAllBallots(toRead, winLossMatrix):
+        kept[ballot.path] = ballot
+
+    ballots = [kept[filepath] for filepath in filepaths]
+    return ballots, (len(toRead) - changed, changed, len(previous) - changed), toRead
+
+
+
+# ==================================================
+#  bring a snapshot of earlier tallies up to date
+#
+#  a snapshot from a different blank ballot or mode
+#    is ignored and everything is read from scratch
+# ==================================================
+
+def updateSnapshot(winLossMatrix):
+    filepaths = getBallotFilepaths()
+
+    snapshotBallots = []
+    if os.path.isfile(args.snapshot):
+        try:
+            snapshotMatrix, snapshotBallots, header = loadTally(args.snapshot)
+            if header["coasterHash"] != coasterListHash(winLossMatrix.names):
+                raise ValueError("it was built from a different blank ballot")
+            if header["pairs"] != winLossMatrix.pairs:
+                raise ValueError("it was built with a different --totals-only setting")
+            winLossMatrix.merge(snapshotMatrix)
+        except Exception as e:
+            print('Ignoring snapshot "{0}": {1}.'.format(args.snapshot, e))
+            snapshotBallots = []
+
+    print("Comparing ballots to the snapshot...", end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    ballots, (added, changed, removed), readPaths = syncBallots(winLossMatrix, snapshotBallots, filepaths)
+    saveTally(args.snapshot, winLossMatrix, ballots)
+
+    if useSpinner:
+        spinner.stop()
+    print("{0} unchanged, {1} new, {2} changed, {3} removed.".format(
+        len(ballots) - added - changed, added, changed, removed))
+    return ballots
+
+
+
+# ==================================================
+#  save everything to the SQLite database
+# ==================================================
+
+def saveDatabase(coasterDict, winLossMatrix, ballots):
+    print("Saving to the database...", end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    try:
+        writeDatabase(args.database, coasterDict, winLossMatrix, ballots)
+    except Exception as e:
+        if useSpinner:
+            spinner.stop()
+        print('\nCould not save database "{0}": {1}.'.format(args.database, e))
+        return
+
+    if useSpinner:
+        spinner.stop()
+    print('saved to "{0}".'.format(args.database))
+
+
+
+# ==================================================
+#  tally ballots from the columnar store, rebuilding
+#    it from the ballot folder if it's out of date
+#
+#  the store is memory mapped, so only the rows of
+#    ballots actually tallied are ever read
+# ==================================================
+
+def updateStore(winLossMatrix):
+    filepaths = getBallotFilepaths()
+
+    store = None
+    if os.path.isfile(args.store):
+        try:
+            store = BallotStore(args.store)
+            if store.coasterHash != coasterListHash(winLossMatrix.names):
+                raise ValueError("it was built from a different blank ballot")
+            if not store.isCurrent(filepaths):
+                raise ValueError("the ballot folder has changed")
+        except Exception as e:
+            print('Rebuilding ballot store "{0}": {1}.'.format(args.store, e))
+            store = None
+
+    if store is None:
+        ballots = tallyAllBallots(filepaths, winLossMatrix)
+        writeStore(args.store, winLossMatrix.names, ballots)
+        return ballots
+
+    print("Tallying ballots from the store...", end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    ballots = store.ballots()
+    for ballot in ballots:
+        if not ballot.error:
+            winLossMatrix.addBallot(ballot.indices, ballot.ranks)
+    store.close()
+
+    if useSpinner:
+        spinner.stop()
+    print("{0} ballots.".format(len(ballots)))
+    return ballots
+
+
+
+# ==================================================
+#  watch the ballot folder and keep results current
+#
+#  the folder is polled every second; once it has been
+#    quiet for args.debounce seconds after a change,
+#    the results (and snapshot, store, or database, if
+#    any) are rewritten
+# ==================================================
+
+def watchBallots(coasterDict, winLossMatrix, ballots, server=None):
+    print('Watching "{0}" for ballots; press Ctrl+C to stop.'.format(args.ballotFolder))
+    pending = False
+    lastChange = 0.0
+    unreported = set() # ballots read since the results were last written
+    try:
+        while True:
+            time.sleep(1.0)
+
+            # the folder itself might be getting moved around; just try again next time
+            try:
+                filepaths = listBallotFilepaths()
+            except OSError:
+                continue
+
+            ballots, (added, changed, removed), readPaths = syncBallots(winLossMatrix, ballots, filepaths)
+            unreported.update(readPaths)
+
+            if added or changed or removed:
+                print("{0}: {1} new, {2} changed, {3} removed ballots.".format(
+                    time.strftime("%H:%M:%S"), added, changed, removed))
+                pending = True
+                lastChange = time.time()
+
+                # queries are cheap to answer, so don't make them wait for the debounce
+                if server:
+                    publishStandings(server, coasterDict, winLossMatrix, ballots)
+
+            if pending and time.time() - lastChange >= args.debounce:
+                pending = False
+                writeResults(coasterDict, winLossMatrix, ballots, reportPaths=unreported)
+                unreported = set()
+                if args.snapshot:
+                    saveTally(args.snapshot, winLossMatrix, ballots)
+                if args.store:
+                    writeStore(args.store, winLossMatrix.names, ballots)
+                if args.database:
+                    saveDatabase(coasterDict, winLossMatrix, ballots)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+
+# hand the server a frozen copy of the current tallies
+def publishStandings(server, coasterDict, winLossMatrix, ballots):
+    ballotCount = sum(1 for ballot in ballots if not ballot.error)
+    server.publish(Standings(winLossMatrix, coasterDict, args.minRiders, ballotCount))
 
 
 
@@ -457,17 +1126,18 @@ def processBallot(filepath, coasterDict, winLossMatrix):
 #  read all ballots and mark spreadsheets
 # ==================================================
 
-def processAllBallots(xl, coasterDict, winLossMatrix):
+def processAllBallots(xl, coasterDict, winLossMatrix, ballots, reportPaths=None):
 
     # include spreadsheet containing identifying voter info, if requested
     if args.includeExtraInfo > 0:
         voterinfows = xl.create_sheet("Voter Info (SENSITIVE)")
-        voterinfows.append(["Ballot Filename","Name","Email","City","State/Province","Country","Coasters Ridden"])
         voterinfows.column_dimensions['A'].width = 24.83
         voterinfows.column_dimensions['B'].width = 16.83
         voterinfows.column_dimensions['C'].width = 24.83
         for col in ['D','E','F','G']:
             voterinfows.column_dimensions[col].width = 12.83
+        voterinfows.freeze_panes = 'A2'
+        voterinfows.append(["Ballot Filename","Name","Email","City","State/Province","Country","Coasters Ridden"])
 
         # include spreadsheet containing individual ballots, if requested
         if args.includeExtraInfo > 1:
@@ -477,44 +1147,47 @@ def processAllBallots(xl, coasterDict, winLossMatrix):
             headerRow = ["Ballot Filename"]
             for i in range(0, len(coasterDict)):
                 headerRow.extend(["Rank","Coaster"])
-            ballotws1.append(headerRow)
             ballotws1.column_dimensions['A'].width = 24.83
             for i in range(0, len(coasterDict)):
                 col1 = (i * 2) + 2
                 col2 = col1 + 1
                 ballotws1.column_dimensions[get_column_letter(col1)].width = 4.83
                 ballotws1.column_dimensions[get_column_letter(col2)].width = 45.83
+            ballotws1.freeze_panes = 'B2'
+            ballotws1.append(headerRow)
 
             # doesn't include rank data; assumes no coasters are ranked the same
             ballotws2 = xl.create_sheet("Ballots Imprecise (SENSITIVE)")
             headerRow = ["Ballot Filename"]
             for i in range(0, len(coasterDict)):
                 headerRow.append("Coaster [Rank {0}]".format(i+1))
-            ballotws2.append(headerRow)
             ballotws2.column_dimensions['A'].width = 24.83
             for i in range(0, len(coasterDict)):
                 ballotws2.column_dimensions[get_column_letter(i+2)].width = 45.83
+            ballotws2.freeze_panes = 'B2'
+            ballotws2.append(headerRow)
 
-    # loop over ballots, processing each and saving requested info
-    for filepath in getBallotFilepaths():
-        voterInfo, ballotRanks = processBallot(filepath, coasterDict, winLossMatrix)
+    # loop over ballots, processing each and saving requested info; with reportPaths,
+    #   only those ballots are reported on (the rest already were)
+    names = winLossMatrix.names
+    for ballot in ballots:
+        if reportPaths is None or ballot.path in reportPaths:
+            voterInfo = reportBallot(ballot)
+        else:
+            voterInfo = ballotVoterInfo(ballot)
         if args.includeExtraInfo > 0 and voterInfo:
             voterinfows.append(voterInfo)
-            if args.includeExtraInfo > 1 and ballotRanks:
+            if args.includeExtraInfo > 1 and len(ballot.indices) > 0:
                 rowVals1 = [voterInfo[0]]
                 rowVals2 = [voterInfo[0]]
-                for coasterAndRank in sorted(ballotRanks.items(), key=lambda x: x[1]):
+                ballotRanks = zip([names[i] for i in ballot.indices], ballot.ranks.tolist())
+                for coasterAndRank in sorted(ballotRanks, key=lambda x: x[1]):
                     if args.verbose > 2:
                         print("{0}.\t{1}".format(coasterAndRank[1], coasterAndRank[0]))
                     rowVals1.extend([coasterAndRank[1], coasterAndRank[0]])
                     rowVals2.append(coasterAndRank[0])
                 ballotws1.append(rowVals1)
                 ballotws2.append(rowVals2)
-    if args.includeExtraInfo > 0:
-        voterinfows.freeze_panes = voterinfows['A2']
-        if args.includeExtraInfo > 1:
-            ballotws1.freeze_panes = ballotws1['B2']
-            ballotws2.freeze_panes = ballotws2['B2']
 
 
 
@@ -534,32 +1207,28 @@ def calculateResults(coasterDict, winLossMatrix):
     if args.verbose > 0:
         print("")
 
-    # iterate through all the pairs in the matrix
-    for coasterA in coasterDict.keys():
-        for coasterB in coasterDict.keys():
-
-            # can't compare a coaster to itself
-            if coasterA != coasterB:
-                pairWins = winLossMatrix[coasterA, coasterB]["Wins"]
-                pairLoss = winLossMatrix[coasterA, coasterB]["Losses"]
-                pairTies = winLossMatrix[coasterA, coasterB]["Ties"]
-                pairContests = pairWins + pairLoss + pairTies
-
-                if pairContests > 0:
-                    winLossMatrix[coasterA, coasterB]["Win Percentage"] = (((pairWins + float(pairTies / 2)) / pairContests)) * 100
-                    
-                    if pairWins == pairLoss:
-                        coasterDict[coasterA].pairwiseTies += 1
-                    elif pairWins > pairLoss:
-                        coasterDict[coasterA].pairwiseWins += 1
-                    else:
-                        coasterDict[coasterA].pairwiseLosses += 1
-
-                    # only print pairwise results with '-vvvv' flag
-                    if args.verbose > 3:
-                        print("{0},{1},\tWins: {2},\tTies: {3},\t#Con: {4},\tWin%: {5}".format(
-                            coasterDict[coasterA].abbr, coasterDict[coasterB].abbr,
-                            pairWins, pairTies, pairContests, winLossMatrix[coasterA, coasterB]["Win Percentage"]))
+    # pair win percentages and pairwise wins/losses/ties, for all pairs at once
+    pairwiseWins, pairwiseLosses, pairwiseTies = winLossMatrix.calculate()
+    for i, x in enumerate(winLossMatrix.names):
+        coasterDict[x].riders = int(winLossMatrix.riders[i])
+        coasterDict[x].totalWins = int(winLossMatrix.totalWins[i])
+        coasterDict[x].totalLosses = int(winLossMatrix.totalLosses[i])
+        coasterDict[x].totalTies = int(winLossMatrix.totalTies[i])
+        coasterDict[x].pairwiseWins = int(pairwiseWins[i])
+        coasterDict[x].pairwiseLosses = int(pairwiseLosses[i])
+        coasterDict[x].pairwiseTies = int(pairwiseTies[i])
+
+    # only print pairwise results with '-vvvv' flag
+    if args.verbose > 3:
+        wins, losses, ties = winLossMatrix.denseCounts()
+        percentages = winLossMatrix.densePercentages()
+        for a, coasterA in enumerate(winLossMatrix.names):
+            for b, coasterB in enumerate(winLossMatrix.names):
+                pairContests = wins[a, b] + losses[a, b] + ties[a, b]
+                if a != b and pairContests > 0:
+                    print("{0},{1},\tWins: {2},\tTies: {3},\t#Con: {4},\tWin%: {5}".format(
+                        coasterDict[coasterA].abbr, coasterDict[coasterB].abbr,
+                        wins[a, b], ties[a, b], pairContests, percentages[a, b]))
 
     for x in coasterDict.keys():
         totalWins = coasterDict[x].totalWins
@@ -572,9 +1241,12 @@ def calculateResults(coasterDict, winLossMatrix):
         pairTies = coasterDict[x].pairwiseTies
         pairContests = pairWins + pairLoss + pairTies
 
+        coasterDict[x].totalWinPercentage = 0.0
+        coasterDict[x].pairwiseWinPercentage = 0.0
         if  totalContests > 0:
             coasterDict[x].totalWinPercentage = ((totalWins + float(totalTies/2)) / totalContests) * 100
-            coasterDict[x].pairwiseWinPercentage = ((pairWins + float(pairTies/2)) / pairContests) * 100
+            if pairContests > 0:
+                coasterDict[x].pairwiseWinPercentage = ((pairWins + float(pairTies/2)) / pairContests) * 100
 
             # print singular results with just a '-v' flag
             if args.verbose > 0:
@@ -592,7 +1264,7 @@ def calculateResults(coasterDict, winLossMatrix):
 #  add to "Tied Coasters" variable in coasterDict
 # ==================================================
 
-def markTies(coasterDict, winLossMatrix, tiedCoasters):
+def markTies(coasterDict, winLossMatrix, hawkerGrid, tiedCoasters):
     for coasterA in tiedCoasters:
         coastersTiedWithA = []
         for coasterB in tiedCoasters:
@@ -601,28 +1273,19 @@ def markTies(coasterDict, winLossMatrix, tiedCoasters):
         coasterDict[coasterA].tiedCoasters = coastersTiedWithA
 
     # print Mitch Hawker-style pairwise matchups between tied coasters with '-v' flag
-    if args.verbose > 0:
+    if args.verbose > 0 and winLossMatrix.pairs:
         print("  ===Tied===", end="\t")
         for coaster in tiedCoasters:
-            print(" {0} ".format(coasterDict[coasterB].abbr), end="\t")
+            print(" {0} ".format(coasterDict[coaster].abbr), end="\t")
         print("")
-        for coasterA in tiedCoasters:
+        tiedIndices = [winLossMatrix.index[x] for x in tiedCoasters]
+        if hawkerGrid is None:
+            hawkerGrid = HawkerGrid(winLossMatrix, tiedIndices)
+        cells = hawkerGrid.cellsInOrder(tiedIndices)
+        for coasterA, row in zip(tiedCoasters, cells.tolist()):
             print("  {0}".format(coasterDict[coasterA].abbr), end="\t")
-            for coasterB in tiedCoasters:
-                cellStr = " "
-                if coasterA != coasterB:
-                    if winLossMatrix[coasterA, coasterB]["Wins"] > winLossMatrix[coasterA, coasterB]["Losses"]:
-                        cellStr += "W "
-                    elif winLossMatrix[coasterA, coasterB]["Wins"] < winLossMatrix[coasterA, coasterB]["Losses"]:
-                        cellStr += "L "
-                    else:
-                        cellStr += "T "
-                    cellStr += str(winLossMatrix[coasterA, coasterB]["Wins"]) + "-"
-                    cellStr += str(winLossMatrix[coasterA, coasterB]["Losses"]) + "-"
-                    cellStr += str(winLossMatrix[coasterA, coasterB]["Ties"])
-                else:
-                    cellStr += "       "
-                print("{0}".format(cellStr), end="\t")
+            for cellStr in row:
+                print(" {0}".format(cellStr or "       "), end="\t")
             print("")
 
 
@@ -639,7 +1302,6 @@ def sortedLists(coasterDict, winLossMatrix):
         spinner.start()
 
     results = []
-    pairPercents = []
 
     # iterate through coasterDict by coasters
     for coasterName in coasterDict.keys():
@@ -648,13 +1310,20 @@ def sortedLists(coasterDict, winLossMatrix):
                             coasterDict[coasterName].totalWinPercentage,
                             coasterDict[coasterName].pairwiseWinPercentage))
 
-    # iterate through winLossMatrix by coaster pairings
-    for coasterPair in winLossMatrix.keys():      
-        pairPercents.append((coasterPair, winLossMatrix[coasterPair]["Win Percentage"]))
-
-    # sort lists by win percentages
+    # sort lists by win percentages; pairs are sorted and ranked (including ties) as arrays
+    #   of the form (primaryCoasterIndices, rivalCoasterIndices, winPercentages, pairwiseRanks),
+    #   but only if the "Ranked Pairs" worksheet or an export is going to be written
     sortedResults = sorted(results, key=lambda x: x[1], reverse=True)
-    sortedPairs = sorted(pairPercents, key=lambda x: x[1], reverse=True)
+    sortedPairs = None
+    if winLossMatrix.pairs and ("pairs" in args.sheets or args.export):
+        sortedPairs = winLossMatrix.rankPairs(minContests=max(args.minContests, int(args.contestedOnly)),
+                                              top=args.topPairs)
+
+    # every head-to-head cell between ranked coasters, formatted once for the ties
+    #   printed below and for each ordering of the Mitch Hawker-style worksheets
+    hawkerGrid = None
+    if winLossMatrix.pairs and ("cvc" in args.sheets or "cvc-pairwin" in args.sheets):
+        hawkerGrid = HawkerGrid(winLossMatrix, [winLossMatrix.index[x[0]] for x in sortedResults])
 
     if args.verbose > 0:
         print("")
@@ -668,7 +1337,7 @@ def sortedLists(coasterDict, winLossMatrix):
         overallRank += 1
         if x[1] != curValue:
             if len(tiedCoasters) > 1: # do stuff on complete list of tied coasters
-                markTies(coasterDict, winLossMatrix, tiedCoasters)
+                markTies(coasterDict, winLossMatrix, hawkerGrid, tiedCoasters)
             curRank = overallRank
             curValue = x[1]
             tiedCoasters = []
@@ -677,24 +1346,13 @@ def sortedLists(coasterDict, winLossMatrix):
         if args.verbose > 0:
             print("Rank: {0},\tVal: {1},  \tCoaster: {2}".format(coasterDict[x[0]].overallRank, x[1], x[0]))
     if len(tiedCoasters) > 1: # in case last few coasters were tied
-        markTies(coasterDict, winLossMatrix, tiedCoasters)
-
-    # determine rankings including ties for pairwise ranks
-    overallRank = 0
-    curRank = 0
-    curValue = 0.0
-    for x in sortedPairs:
-        overallRank += 1
-        if x[1] != curValue:
-            curRank = overallRank
-            curValue = x[1]
-        winLossMatrix[x[0][0], x[0][1]]["Pairwise Rank"] = curRank
+        markTies(coasterDict, winLossMatrix, hawkerGrid, tiedCoasters)
 
     if useSpinner:
         spinner.stop()
     print(" ")
 
-    return sortedResults, sortedPairs
+    return sortedResults, sortedPairs, hawkerGrid
 
 
 
@@ -702,20 +1360,62 @@ def sortedLists(coasterDict, winLossMatrix):
 #  print everything to a file
 # ==================================================
 
-def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWidthFont, manuColors):
+def printToFile(xl, results, pairs, hawkerGrid, winLossMatrix, coasterDict, preferredFixedWidthFont, namedStyles):
     print("Writing the results...", end=" ")
     if useSpinner:
         spinner = Spinner()
         spinner.start()
 
-    # create and write primary results worksheet
-    resultws = xl.create_sheet("Ranked Results")
+    # (worksheet, function that writes it, what else it needs), in workbook order,
+    #   for each worksheet picked with --sheets
+    sheets = []
+    if "results" in args.sheets:
+        sheets.append((xl.create_sheet("Ranked Results"), writeRankedResults,
+                       (results, winLossMatrix, coasterDict, namedStyles)))
+
+    # a totals-only run has nothing more to write
+    if winLossMatrix.pairs:
+        resortedResults = sorted(results, key=lambda x: x[2], reverse=True)
+        if args.verbose > 0:
+            print(" ")
+            for x in resortedResults:
+                print("Rank: {0},\tVal: {1},  \tCoaster: {2}".format(coasterDict[x[0]].overallRank, x[2], x[0]))
+
+        if "pairs" in args.sheets:
+            sheets.append((xl.create_sheet("Ranked Pairs"), writeRankedPairs,
+                           (pairs, winLossMatrix, coasterDict, namedStyles)))
+
+        # Mitch Hawker-style mutual rider comparisons, by TotalWin% and by PairWin%
+        if "cvc" in args.sheets:
+            sheets.append((xl.create_sheet("Coaster vs Coaster Win-Loss-Tie"), writeHawkerSheet,
+                           (results, hawkerGrid, winLossMatrix, coasterDict, preferredFixedWidthFont, namedStyles, True)))
+        if "cvc-pairwin" in args.sheets:
+            sheets.append((xl.create_sheet("CvC Win-Loss-Tie by PairWin%"), writeHawkerSheet,
+                           (resortedResults, hawkerGrid, winLossMatrix, coasterDict, preferredFixedWidthFont, namedStyles)))
+
+        if "comparison" in args.sheets:
+            sheets.append((xl.create_sheet("TotalWin% vs PairWin% Rankings"), writeRankComparison,
+                           (resortedResults, coasterDict, namedStyles)))
+
+    for ws, writeSheet, writeArgs in sheets:
+        writeSheet(ws, *writeArgs)
+
+    if useSpinner:
+        spinner.stop()
+    print(" ")
+
+
+
+# ==================================================
+#  write the primary results worksheet
+# ==================================================
+
+def writeRankedResults(resultws, results, winLossMatrix, coasterDict, namedStyles):
     headerRow = ["Rank","Coaster","Total Win Percentage","Pairwise Win Percentage",
                  "Total Wins","Total Losses","Total Ties","Pair Wins","Pair Losses",
                  "Pair Ties","Number of Riders"]
     if args.botherRCDB:
         headerRow.extend(["Designer/Manufacturer", "Year"])
-    resultws.append(headerRow)
     resultws.column_dimensions['A'].width = 4.83
     resultws.column_dimensions['B'].width = 45.83
     resultws.column_dimensions['C'].width = 16.83
@@ -730,9 +1430,18 @@ def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWi
     if args.botherRCDB:
         resultws.column_dimensions['L'].width = 23.83
         resultws.column_dimensions['M'].width = 8.83
-    i = 2
+    resultws.freeze_panes = 'A2'
+    resultws.append(headerRow)
+
+    # a totals-only run has no pairwise results, so those columns are left blank
+    def appendResult(rowVals, coaster):
+        if not winLossMatrix.pairs:
+            for l in (4, 8, 9, 10):
+                rowVals[l-1] = None
+        resultws.append(colorizeRow(resultws, rowVals, [2,12], coasterDict, coaster, namedStyles))
+
     for x in results:
-        resultws.append([coasterDict[x[0]].overallRank, x[0],
+        appendResult([coasterDict[x[0]].overallRank, x[0],
                          coasterDict[x[0]].totalWinPercentage,
                          coasterDict[x[0]].pairwiseWinPercentage,
                          coasterDict[x[0]].totalWins,
@@ -743,15 +1452,12 @@ def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWi
                          coasterDict[x[0]].pairwiseTies,
                          coasterDict[x[0]].riders,
                          coasterDict[x[0]].designer,
-                         coasterDict[x[0]].year])
-        colorizeRow(resultws, i, [2,12], coasterDict, x[0], manuColors)
-        i += 1
-    resultws.freeze_panes = resultws['A2']
+                         coasterDict[x[0]].year], x[0])
 
     # append coasters that weren't ranked to the bottom of results worksheet
     for x in coasterDict.keys():
         if x not in [y[0] for y in results] and coasterDict[x].riders > 0:
-            resultws.append(["N/A", x,
+            appendResult(["N/A", x,
                              "Insufficient Riders, {0}".format(coasterDict[x].totalWinPercentage),
                              "Insufficient Riders, {0}".format(coasterDict[x].pairwiseWinPercentage),
                              coasterDict[x].totalWins,
@@ -762,14 +1468,12 @@ def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWi
                              coasterDict[x].pairwiseTies,
                              coasterDict[x].riders,
                              coasterDict[x].designer,
-                             coasterDict[x].year])
-            colorizeRow(resultws, i, [2,12], coasterDict, x, manuColors)
-            i += 1
+                             coasterDict[x].year], x)
 
     # append coasters that weren't ridden to the bottom of results worksheet
     for x in coasterDict.keys():
         if x not in [y[0] for y in results] and coasterDict[x].riders == 0:
-            resultws.append(["N/A", x, "No Riders", "No Riders",
+            appendResult(["N/A", x, "No Riders", "No Riders",
                              coasterDict[x].totalWins,
                              coasterDict[x].totalLosses,
                              coasterDict[x].totalTies,
@@ -778,13 +1482,15 @@ def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWi
                              coasterDict[x].pairwiseTies,
                              coasterDict[x].riders,
                              coasterDict[x].designer,
-                             coasterDict[x].year])
-            colorizeRow(resultws, i, [2,12], coasterDict, x, manuColors)
-            i += 1
+                             coasterDict[x].year], x)
 
-    # create and write pairwise result worksheet
-    pairws = xl.create_sheet("Ranked Pairs")
-    pairws.append(["Rank","Primary Coaster","Rival Coaster","Win Percentage","Wins","Losses","Ties"])
+
+
+# ==================================================
+#  write the pairwise results worksheet
+# ==================================================
+
+def writeRankedPairs(pairws, pairs, winLossMatrix, coasterDict, namedStyles):
     pairws.column_dimensions['A'].width = 4.83
     pairws.column_dimensions['B'].width = 45.83
     pairws.column_dimensions['C'].width = 45.83
@@ -792,127 +1498,160 @@ def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWi
     pairws.column_dimensions['E'].width = 4.5
     pairws.column_dimensions['F'].width = 5.5
     pairws.column_dimensions['G'].width = 3.83
-    i = 2
-    for x in pairs:
-        pairws.append([winLossMatrix[x[0][0], x[0][1]]["Pairwise Rank"], x[0][0], x[0][1],
-                       winLossMatrix[x[0][0], x[0][1]]["Win Percentage"],
-                       winLossMatrix[x[0][0], x[0][1]]["Wins"],
-                       winLossMatrix[x[0][0], x[0][1]]["Losses"],
-                       winLossMatrix[x[0][0], x[0][1]]["Ties"]])
-        colorizeRow(pairws, i, [2], coasterDict, x[0][0], manuColors)
-        colorizeRow(pairws, i, [3], coasterDict, x[0][1], manuColors)
-        i += 1
-    pairws.freeze_panes = pairws['A2']
-
-    # create and write Mitch Hawker-style mutual rider comparison worksheet
-    hawkerWLTws = xl.create_sheet("Coaster vs Coaster Win-Loss-Tie")
-    headerRow = ["Rank",""]
-    for coaster in results:
-        headerRow.append(coasterDict[coaster[0]].abbr)
-    hawkerWLTws.append(headerRow)
-    hawkerWLTws.column_dimensions['A'].width = 4.83
-    hawkerWLTws.column_dimensions['B'].width = 45.83
-    for col in range(3, len(results)+3):
-        hawkerWLTws.column_dimensions[get_column_letter(col)].width = 12.83
-        colorizeRow(hawkerWLTws, 1, [col], coasterDict, results[col-3][0], manuColors)
-    for i in range(0, len(results)):
-        resultRow = [coasterDict[results[i][0]].overallRank, results[i][0]]
-        winCount = 0
-        loseCount = 0
-        tieCount = 0
-        for j in range(0, len(results)):
-            coasterA = results[i][0]
-            coasterB = results[j][0]
-            cellStr = ""
-            if coasterA != coasterB:
-                if winLossMatrix[coasterA, coasterB]["Wins"] > winLossMatrix[coasterA, coasterB]["Losses"]:
-                    cellStr += "W "
-                    winCount += 1
-                elif winLossMatrix[coasterA, coasterB]["Wins"] < winLossMatrix[coasterA, coasterB]["Losses"]:
-                    cellStr += "L "
-                    loseCount += 1
-                else:
-                    cellStr += "T "
-                    tieCount += 1
-                cellStr += str(winLossMatrix[coasterA, coasterB]["Wins"]) + "-"
-                cellStr += str(winLossMatrix[coasterA, coasterB]["Losses"]) + "-"
-                cellStr += str(winLossMatrix[coasterA, coasterB]["Ties"])
-            resultRow.append(cellStr)
-        hawkerPct = ((winCount + (tieCount/float(2))/float(len(results)-1))* 100)
-        resultRow.append(hawkerPct)
-        hawkerWLTws.append(resultRow)
-        colorizeRow(hawkerWLTws, i+2, [2], coasterDict, results[i][0], manuColors)
-    hawkerWLTws.freeze_panes = hawkerWLTws['C2']
-    for col in hawkerWLTws.iter_cols(min_col=3):
-        for cell in col:
-            cell.font = preferredFixedWidthFont
-
-    # create and write Mitch Hawker-style mutual rider comparison worksheet sorted by Pairwise Win Percentage
-    resortedResults = sorted(results, key=lambda x: x[2], reverse=True)
-    hawkerWLT2 = xl.create_sheet("CvC Win-Loss-Tie by PairWin%")
+    pairws.freeze_panes = 'A2'
+    pairws.append(["Rank","Primary Coaster","Rival Coaster","Win Percentage","Wins","Losses","Ties"])
+    primary, rival, percentages, pairRanks = pairs
+    wins, losses, ties = winLossMatrix.pairCounts(primary, rival)
+    names = winLossMatrix.names
+    for a, b, pct, rank, pairWins, pairLoss, pairTies in zip(primary.tolist(), rival.tolist(),
+            percentages.tolist(), pairRanks.tolist(), wins.tolist(), losses.tolist(), ties.tolist()):
+        rowVals = [rank, names[a], names[b], pct, pairWins, pairLoss, pairTies]
+        colorizeRow(pairws, rowVals, [2], coasterDict, names[a], namedStyles)
+        colorizeRow(pairws, rowVals, [3], coasterDict, names[b], namedStyles)
+        pairws.append(rowVals)
+
+
+
+# ==================================================
+#  write a Mitch Hawker-style worksheet of every
+#    ranked coaster's W-L-T against every other,
+#    in the order of orderedResults
+# ==================================================
+
+def writeHawkerSheet(hawkerws, orderedResults, hawkerGrid, winLossMatrix, coasterDict,
+                     preferredFixedWidthFont, namedStyles, hawkerPct=False):
     headerRow = ["Rank",""]
-    if args.verbose > 0:
-        print(" ")
-    for x in resortedResults:
+    for x in orderedResults:
         headerRow.append(coasterDict[x[0]].abbr)
-        if args.verbose > 0:
-            print("Rank: {0},\tVal: {1},  \tCoaster: {2}".format(coasterDict[x[0]].overallRank, x[2], x[0]))
-    hawkerWLT2.append(headerRow)
-    hawkerWLT2.column_dimensions['A'].width = 4.83
-    hawkerWLT2.column_dimensions['B'].width = 45.83
-    for col in range(3, len(resortedResults)+3):
-        hawkerWLT2.column_dimensions[get_column_letter(col)].width = 12.83
-        colorizeRow(hawkerWLT2, 1, [col], coasterDict, resortedResults[col-3][0], manuColors)
-    for i in range(0, len(resortedResults)):
-        resultRow = [coasterDict[resortedResults[i][0]].overallRank, resortedResults[i][0]]
-        for j in range(0, len(resortedResults)):
-            coasterA = resortedResults[i][0]
-            coasterB = resortedResults[j][0]
-            cellStr = ""
-            if coasterA != coasterB:
-                if winLossMatrix[coasterA, coasterB]["Wins"] > winLossMatrix[coasterA, coasterB]["Losses"]:
-                    cellStr += "W "
-                elif winLossMatrix[coasterA, coasterB]["Wins"] < winLossMatrix[coasterA, coasterB]["Losses"]:
-                    cellStr += "L "
-                else:
-                    cellStr += "T "
-                cellStr += str(winLossMatrix[coasterA, coasterB]["Wins"]) + "-"
-                cellStr += str(winLossMatrix[coasterA, coasterB]["Losses"]) + "-"
-                cellStr += str(winLossMatrix[coasterA, coasterB]["Ties"])
-            resultRow.append(cellStr)
-        hawkerWLT2.append(resultRow)
-        colorizeRow(hawkerWLT2, i+2, [2], coasterDict, resortedResults[i][0], manuColors)
-    hawkerWLT2.freeze_panes = hawkerWLT2['C2']
-    for col in hawkerWLT2.iter_cols(min_col=3):
-        for cell in col:
-            cell.font = preferredFixedWidthFont
-
-    # create and write sheet to compare where coasters would have ranked if sorted by PairWin%
-    comparisonws = xl.create_sheet("TotalWin% vs PairWin% Rankings")
-    comparisonws.append(["Coaster","TotalWin% Rank","PairWin% Rank","Difference"])
+    hawkerws.column_dimensions['A'].width = 4.83
+    hawkerws.column_dimensions['B'].width = 45.83
+    for col in range(3, len(orderedResults)+3):
+        hawkerws.column_dimensions[get_column_letter(col)].width = 12.83
+        colorizeRow(hawkerws, headerRow, [col], coasterDict, orderedResults[col-3][0], namedStyles)
+    hawkerws.freeze_panes = 'C2'
+
+    # every column from the third on (including the Hawker percentage) is fixed-width;
+    #   the header gets the font on top of its colors, every other row the named style
+    fixedWidthCols = range(3, len(orderedResults)+(4 if hawkerPct else 3))
+    hawkerws.append(styleColumns(hawkerws, headerRow, fixedWidthCols, font=preferredFixedWidthFont))
+
+    # the grid's rows and columns put in this sheet's order
+    order = [winLossMatrix.index[x[0]] for x in orderedResults]
+    positions = hawkerGrid.positions(order)
+    cells = hawkerGrid.cellsInOrder(order).tolist()
+    pairWins = hawkerGrid.pairWins[positions].tolist()
+    pairTies = hawkerGrid.pairTies[positions].tolist()
+
+    for i in range(0, len(orderedResults)):
+        resultRow = [coasterDict[orderedResults[i][0]].overallRank, orderedResults[i][0]] + cells[i]
+        if hawkerPct:
+            resultRow.append(((pairWins[i] + (pairTies[i]/float(2))/float(len(orderedResults)-1))* 100))
+        colorizeRow(hawkerws, resultRow, [2], coasterDict, orderedResults[i][0], namedStyles)
+        hawkerws.append(styleColumns(hawkerws, resultRow, fixedWidthCols, style=namedStyles["Fixed Width"]))
+
+
+
+# ==================================================
+#  write a worksheet comparing where coasters would
+#    have ranked if sorted by PairWin%
+# ==================================================
+
+def writeRankComparison(comparisonws, resortedResults, coasterDict, namedStyles):
     comparisonws.column_dimensions['A'].width = 45.83
     comparisonws.column_dimensions['B'].width = 12.83
     comparisonws.column_dimensions['C'].width = 12.83
+    comparisonws.freeze_panes = 'A2'
+    comparisonws.append(["Coaster","TotalWin% Rank","PairWin% Rank","Difference"])
+
+    # differences shade from white toward red (falling 16+ places) or green (rising 16+);
+    #   with no ranked coasters yet, there's no range to shade
+    if resortedResults:
+        comparisonws.conditional_formatting.add("D2:D{0}".format(len(resortedResults)+1),
+            ColorScaleRule(start_type="num", start_value=-16, start_color="ff0000",
+                           mid_type="num", mid_value=0, mid_color="ffffff",
+                           end_type="num", end_value=16, end_color="00ff00"))
     for i in range(0, len(resortedResults)):
         coaster = resortedResults[i][0]
         oldRank = coasterDict[coaster].overallRank
         newRank = i+1
         diff = oldRank - newRank
         if diff == 0:
-            comparisonws.append([coaster, oldRank, newRank, ""])
+            rowVals = [coaster, oldRank, newRank, ""]
         else:
-            comparisonws.append([coaster, oldRank, newRank, diff])
-            if diff <= -16:
-                diffColor = "ff0000" # maximum red
-            elif diff < 0:
-                diffColor = "ff{0}{0}".format(hex(256 + 16 * diff)[2:]) # gradual red
-            elif diff < 16:
-                diffColor = "{0}ff{0}".format(hex(256 - 16 * diff)[2:]) # gradual green
-            else:
-                diffColor = "00ff00" # maximum green
-            comparisonws.cell(row=i+2, column=4).fill = PatternFill("solid", fgColor=diffColor)
-        colorizeRow(comparisonws, i+2, [1], coasterDict, coaster, manuColors)
-    comparisonws.freeze_panes = comparisonws['A2']
+            rowVals = [coaster, oldRank, newRank, diff]
+        colorizeRow(comparisonws, rowVals, [1], coasterDict, coaster, namedStyles)
+        comparisonws.append(rowVals)
+
+
+
+# ==================================================
+#  write the results, pairs, and every coaster's
+#    stats as plain tables beside the output file,
+#    e.g. "Poll Results.results.csv"
+#
+#  rows go out as they're made; unranked coasters
+#    have no rank, and a totals-only run has no
+#    pairwise numbers or pairs table
+# ==================================================
+
+def exportResults(exportFormat, results, pairs, winLossMatrix, coasterDict):
+    print("Exporting the results as {0}...".format(exportFormat), end=" ")
+    if useSpinner:
+        spinner = Spinner()
+        spinner.start()
+
+    def exportPath(table):
+        return "{0}.{1}.{2}".format(args.outfile[:-5], table, exportFormat)
+
+    def pairwise(value):
+        return value if winLossMatrix.pairs else None
+
+    resultColumns = [("rank", "int"), ("coaster", "str"), ("totalWinPercentage", "float"),
+                     ("pairwiseWinPercentage", "float"), ("totalWins", "int"), ("totalLosses", "int"),
+                     ("totalTies", "int"), ("pairwiseWins", "int"), ("pairwiseLosses", "int"),
+                     ("pairwiseTies", "int"), ("riders", "int"), ("designer", "str"), ("year", "str")]
+    out = openExporter(exportPath("results"), exportFormat, resultColumns)
+    try:
+        # ranked coasters first, then those with too few riders, then those with none
+        ranked = set(x[0] for x in results)
+        unranked = [x for x in coasterDict.keys() if x not in ranked]
+        for x in ([y[0] for y in results] + [y for y in unranked if coasterDict[y].riders > 0] +
+                  [y for y in unranked if coasterDict[y].riders == 0]):
+            c = coasterDict[x]
+            out.writeRow([c.overallRank if x in ranked else None, x, c.totalWinPercentage,
+                          pairwise(c.pairwiseWinPercentage), c.totalWins, c.totalLosses, c.totalTies,
+                          pairwise(c.pairwiseWins), pairwise(c.pairwiseLosses), pairwise(c.pairwiseTies),
+                          c.riders, c.designer, c.year])
+    finally:
+        out.close()
+
+    coasterColumns = [("uniqueID", "str"), ("abbr", "str"), ("name", "str"), ("park", "str"),
+                      ("location", "str"), ("rcdb", "str"), ("designer", "str"), ("year", "str")]
+    coasterColumns += resultColumns[2:11]
+    out = openExporter(exportPath("coasters"), exportFormat, coasterColumns)
+    try:
+        for c in coasterDict.values():
+            out.writeRow([c.uniqueID, c.abbr, c.name, c.park, c.location, c.rcdb, c.designer, c.year,
+                          c.totalWinPercentage, pairwise(c.pairwiseWinPercentage), c.totalWins,
+                          c.totalLosses, c.totalTies, pairwise(c.pairwiseWins), pairwise(c.pairwiseLosses),
+                          pairwise(c.pairwiseTies), c.riders])
+    finally:
+        out.close()
+
+    # every ordered pair, as in the "Ranked Pairs" worksheet
+    if pairs is not None:
+        pairColumns = [("rank", "int"), ("primaryCoaster", "str"), ("rivalCoaster", "str"),
+                       ("winPercentage", "float"), ("wins", "int"), ("losses", "int"), ("ties", "int")]
+        out = openExporter(exportPath("pairs"), exportFormat, pairColumns)
+        try:
+            primary, rival, percentages, pairRanks = pairs
+            wins, losses, ties = winLossMatrix.pairCounts(primary, rival)
+            names = winLossMatrix.names
+            for a, b, pct, rank, pairWins, pairLoss, pairTies in zip(primary.tolist(), rival.tolist(),
+                    percentages.tolist(), pairRanks.tolist(), wins.tolist(), losses.tolist(), ties.tolist()):
+                out.writeRow([rank, names[a], names[b], pct, pairWins, pairLoss, pairTies])
+        finally:
+            out.close()
 
     if useSpinner:
         spinner.stop()
@@ -925,7 +1664,11 @@ def printToFile(xl, results, pairs, winLossMatrix, coasterDict, preferredFixedWi
 # ==================================================
 
 if __name__ == "__main__": # allows us to put main at the beginning
-    main()
+    try:
+        main()
+    finally:
+        if tallyPool is not None:
+            tallyPool.shutdown()
 
 
 
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# Checks that every way of getting to the results gives the same workbook as
+#   a plain run over the fixture ballots in fixtures/ballots: reading them with
+#   -j, as shards merged afterwards, out of a zip archive, through a snapshot
+#   (kept up to date as ballots are added, changed, and removed), through the
+#   ballot store, and with --database; also checks the tallies against a plain
+#   pair-by-pair count of the ballots, the database's views against the Ranked
+#   Results and Ranked Pairs worksheets, and that the win/loss matrix only takes
+#   memory for the pairs the ballots contest, however many coasters there are
+# Author: Grant Barker
+
+import os
+import re
+import sys
+import shutil
+import sqlite3
+import zipfile
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from openpyxl import load_workbook
+
+try:
+    from ballotsource import scanBallotFolder
+except:
+    print('Could not find "ballotsource.py"; exiting...')
+    sys.exit()
+try:
+    from ballot import tallyBallots, startLine, commentStr
+except:
+    print('Could not find "ballot.py"; exiting...')
+    sys.exit()
+try:
+    from matrix import WinLossMatrix
+except:
+    print('Could not find "matrix.py"; exiting...')
+    sys.exit()
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# command line arguments
+parser = argparse.ArgumentParser(description='Check that every way of tallying ballots gives the same results.')
+
+parser.add_argument("-b", "--blankBallot", default=os.path.join(here, "fixtures", "blankballot.txt"),
+                    help="specify blank ballot file the fixture ballots were filled in from")
+parser.add_argument("--fixtures", default=os.path.join(here, "fixtures", "ballots"),
+                    help="specify folder of fixture ballots")
+
+args = parser.parse_args()
+
+failures = 0
+
+def check(description, passed):
+    global failures
+    print("{0}: {1}".format("ok" if passed else "FAILED", description))
+    if not passed:
+        failures += 1
+
+# run the tabulator over a ballot folder (or archive); returns what it printed
+def tabulate(ballotFolder, outfile, *extra):
+    return subprocess.run([sys.executable, os.path.join(here, "tabulator.py"), "-b", args.blankBallot,
+                           "-f", ballotFolder, "-o", outfile, "-m", "2", "-ii", "--no-cache"] + list(extra),
+                          stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+
+# every worksheet's title and cell values, in workbook order
+def workbookValues(path):
+    workbook = load_workbook(path, read_only=True)
+    values = [(ws.title, [list(row) for row in ws.iter_rows(values_only=True)]) for ws in workbook.worksheets]
+    workbook.close()
+    return values
+
+# copy these ballot files into folder, keeping their places under the fixture folder
+def copyBallots(filepaths, folder):
+    for filepath in filepaths:
+        destination = os.path.join(folder, os.path.relpath(filepath, args.fixtures))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy(filepath, destination)
+
+# (unchanged, new, changed, removed) from a snapshot run's report
+def snapshotCounts(output):
+    found = re.search(r"([0-9]+) unchanged, ([0-9]+) new, ([0-9]+) changed, ([0-9]+) removed", output)
+    return tuple(int(x) for x in found.groups()) if found else None
+
+# wins, losses, and ties of every ordered pair of coasters, counted one ballot and
+#   one pair at a time from the database's ballot rows
+def countPairs(conn):
+    ballots = {}
+    for voter, coaster, rank in conn.execute("SELECT voter, coaster, rank FROM ballotRows"):
+        ballots.setdefault(voter, []).append((coaster, rank))
+    counts = {}
+    for ranked in ballots.values():
+        for a, rankA in ranked:
+            for b, rankB in ranked:
+                if a != b:
+                    wins, losses, ties = counts.get((a, b), (0, 0, 0))
+                    counts[(a, b)] = (wins + (rankA < rankB), losses + (rankA > rankB), ties + (rankA == rankB))
+    return counts
+
+# the sheet shows "Insufficient Riders, 12.5" for coasters below the minimum
+def sheetPercentage(value):
+    if isinstance(value, str):
+        return float(value.split(", ")[-1])
+    return value
+
+def checkDatabase(database, values):
+    conn = sqlite3.connect(database)
+    try:
+        counts = countPairs(conn)
+        matchups = {(a, b): (wins, losses, ties) for a, b, wins, losses, ties in
+                    conn.execute("SELECT coaster, rival, wins, losses, ties FROM matchups")}
+        check("the tallies match a pair-by-pair count of the ballots", matchups == counts)
+
+        totals = {}
+        for (a, b), (wins, losses, ties) in counts.items():
+            totalWins, totalLosses, totalTies = totals.get(a, (0, 0, 0))
+            totals[a] = (totalWins + wins, totalLosses + losses, totalTies + ties)
+        tallies = {coaster: (wins, losses, ties) for coaster, riders, wins, losses, ties in
+                   conn.execute("SELECT * FROM coasterTallies WHERE riders > 0 AND totalWins + totalLosses + totalTies > 0")}
+        check("the total wins, losses, and ties match the ballots", tallies == totals)
+
+        # coasterResults against Ranked Results, coaster by coaster (coasters nobody
+        #   rode are listed there too, as "No Riders")
+        sheet = [row for row in dict(values)["Ranked Results"][1:] if row[10]]
+        results = {row[1]: row for row in conn.execute("""
+            SELECT riders, uniqueID, totalWins, totalLosses, totalTies, pairwiseWins, pairwiseLosses,
+                   pairwiseTies, totalWinPercentage, pairwiseWinPercentage
+            FROM coasterResults WHERE riders > 0""")}
+        def sameResult(row):
+            result = results.get(row[1])
+            return (result is not None and list(result[:1]) == [row[10]] and list(result[2:8]) == row[4:10] and
+                    abs(result[8] - sheetPercentage(row[2])) < 1e-9 and abs(result[9] - sheetPercentage(row[3])) < 1e-9)
+        check("the coasterResults view matches Ranked Results",
+              len(sheet) == len(results) and all(sameResult(row) for row in sheet))
+
+        # matchups against Ranked Pairs, for the pairs it lists that were contested
+        sheet = dict(values)["Ranked Pairs"][1:]
+        listed = set(row[1] for row in sheet)
+        names = dict(conn.execute("SELECT id, uniqueID FROM coasters"))
+        sheetPairs = {(row[1], row[2]): tuple(row[4:7]) for row in sheet if sum(row[4:7]) > 0}
+        viewPairs = {(names[a], names[b]): record for (a, b), record in matchups.items()
+                     if names[a] in listed and names[b] in listed}
+        check("the matchups view matches Ranked Pairs", sheetPairs == viewPairs)
+    finally:
+        conn.close()
+
+# full names of the coasters on the blank ballot, in ballot order
+def blankBallotCoasters():
+    names = []
+    with open(args.blankBallot) as f:
+        lines = [line.strip() for line in f]
+    for sline in lines[lines.index(startLine) + 1:]:
+        words = [x.strip() for x in sline.split(',')]
+        if sline != "" and commentStr not in sline and len(words) >= 3:
+            names.append(words[1])
+    return names
+
+# tally the fixture ballots with this many coasters on the ballot (any past the
+#   blank ballot's are never ranked); returns the matrix and the most memory used
+def tallyWithCoasters(ballotFiles, coasterCount):
+    names = blankBallotCoasters()
+    names += ["Unridden Coaster {0}".format(i) for i in range(coasterCount - len(names))]
+    tracemalloc.start()
+    try:
+        winLossMatrix = WinLossMatrix(names)
+        tallyBallots(ballotFiles, winLossMatrix)
+        winLossMatrix.calculate()
+        winLossMatrix.rankPairs(top=10)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return winLossMatrix, peak
+
+# the pair tallies only grow with the pairs the ballots contest: 20,000 more
+#   coasters nobody rode add nothing to them, and the whole tally stays far below
+#   the 12 bytes per pair (2.4 GB here) of a full matrix
+def checkMemory(ballotFiles):
+    small, smallPeak = tallyWithCoasters(ballotFiles, len(blankBallotCoasters()))
+    large, largePeak = tallyWithCoasters(ballotFiles, 20000)
+    smallTallies = small.pairTallies()
+    largeTallies = large.pairTallies()
+    # a pair's key depends on the number of coasters, so compare the coasters themselves
+    samePairs = [(x == y).all() for x, y in zip(small.pairCoasters(smallTallies[0]), large.pairCoasters(largeTallies[0]))]
+    check("the pair tallies take the same memory with 20,000 coasters as with {0}".format(small.size),
+          sum(x.nbytes for x in largeTallies) == sum(x.nbytes for x in smallTallies) and all(samePairs) and
+          all((x == y).all() for x, y in zip(smallTallies[1:], largeTallies[1:])))
+    check("the pair tallies only hold contested pairs",
+          len(largeTallies[0]) == len(small.contestedPairs) and (small.contests > 0).all())
+    denseBytes = 12 * large.size * (large.size - 1) // 2
+    check("tallying with 20,000 coasters peaks at {0:.1f} MB, not the {1:.1f} GB of a full matrix".format(
+          largePeak / 1e6, denseBytes / 1e9), largePeak < denseBytes / 100)
+
+def main():
+    ballotFiles = scanBallotFolder(args.fixtures)
+    checkMemory(ballotFiles)
+
+    with tempfile.TemporaryDirectory() as folder:
+        def path(name):
+            return os.path.join(folder, name)
+
+        tabulate(args.fixtures, path("serial.xlsx"))
+        serial = workbookValues(path("serial.xlsx"))
+        check("a plain run writes every worksheet", len(serial) == 9)
+
+        # worker processes
+        tabulate(args.fixtures, path("jobs.xlsx"), "-j", "3")
+        check("-j 3 gives the same workbook", workbookValues(path("jobs.xlsx")) == serial)
+
+        # two shards, merged
+        half = len(ballotFiles) // 2
+        copyBallots(ballotFiles[:half], path("part1"))
+        copyBallots(ballotFiles[half:], path("part2"))
+        tabulate(path("part1"), path("part1.xlsx"), "--tabulate-shard", path("part1.npz"))
+        tabulate(path("part2"), path("part2.xlsx"), "--tabulate-shard", path("part2.npz"))
+        subprocess.run([sys.executable, os.path.join(here, "tabulator.py"), "-b", args.blankBallot, "-m", "2", "-ii",
+                        "--merge", path("part1.npz"), path("part2.npz"), "-o", path("merged.xlsx")],
+                       stdout=subprocess.PIPE, check=True)
+        check("merging two shards gives the same workbook", workbookValues(path("merged.xlsx")) == serial)
+
+        # a zip archive of the folder
+        with zipfile.ZipFile(path("ballots.zip"), "w") as archive:
+            for filepath in ballotFiles:
+                archive.write(filepath, os.path.relpath(filepath, args.fixtures))
+        tabulate(path("ballots.zip"), path("archive.xlsx"))
+        check("reading a zip archive gives the same workbook", workbookValues(path("archive.xlsx")) == serial)
+
+        # the ballot store, as it's built and when it's read back
+        tabulate(args.fixtures, path("store1.xlsx"), "--store", path("ballots.store"))
+        check("building the ballot store gives the same workbook", workbookValues(path("store1.xlsx")) == serial)
+        output = tabulate(args.fixtures, path("store2.xlsx"), "--store", path("ballots.store"))
+        check("tallying from the ballot store gives the same workbook",
+              "Tallying ballots from the store" in output and workbookValues(path("store2.xlsx")) == serial)
+
+        # the database, and its views against the workbook
+        tabulate(args.fixtures, path("database.xlsx"), "--database", path("ballots.db"))
+        check("saving a database gives the same workbook", workbookValues(path("database.xlsx")) == serial)
+        checkDatabase(path("ballots.db"), serial)
+
+        # a snapshot, first built, then used as is, then brought up to date
+        live = path("live")
+        copyBallots(ballotFiles, live)
+        output = tabulate(live, path("snapshot1.xlsx"), "--snapshot", path("snapshot.npz"))
+        check("building a snapshot gives the same workbook",
+              snapshotCounts(output) == (0, len(ballotFiles), 0, 0) and workbookValues(path("snapshot1.xlsx")) == serial)
+        output = tabulate(live, path("snapshot2.xlsx"), "--snapshot", path("snapshot.npz"))
+        check("an up-to-date snapshot reads nothing and gives the same workbook",
+              snapshotCounts(output) == (len(ballotFiles), 0, 0, 0) and workbookValues(path("snapshot2.xlsx")) == serial)
+
+        # one ballot changed, one added, and one removed (the changed one also
+        #   gets the ballot that was rejected for a bad rank, so it counts now)
+        liveFiles = scanBallotFolder(live)
+        with open(liveFiles[1], "w", encoding="utf-8") as f, open(liveFiles[4], encoding="utf-8") as g:
+            f.write(g.read().replace("\nx", "\n"))
+        shutil.copy(liveFiles[2], os.path.join(live, "late", "ballot99.txt"))
+        os.remove(liveFiles[5])
+        output = tabulate(live, path("snapshot3.xlsx"), "--snapshot", path("snapshot.npz"))
+        tabulate(live, path("changed.xlsx"))
+        check("an out-of-date snapshot reads only the new and changed ballots",
+              snapshotCounts(output) == (len(ballotFiles) - 2, 1, 1, 1))
+        check("an out-of-date snapshot gives the same workbook as a plain run",
+              workbookValues(path("snapshot3.xlsx")) == workbookValues(path("changed.xlsx")))
+
+    if failures:
+        print("{0} checks failed.".format(failures))
+        sys.exit(1)
+    print("All checks passed.")
+
+if __name__ == "__main__":
+    main()
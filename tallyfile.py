@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# ==========================================================
+#  ElloCoaster poll tabulator: partial tally files
+#  Author: Grant Barker
+#
+#  A tally file holds everything needed to finish a poll
+#    without rereading ballots: the win/loss matrix, the
+#    per-coaster totals, and every ballot that was read
+# ==========================================================
+
+import json
+import hashlib
+import numpy as np
+
+from ballot import Ballot
+from matrix import WinLossMatrix
+
+tallyFileVersion = 3
+
+# fingerprint of the coasters on a blank ballot, in ballot order
+def coasterListHash(coasterNames):
+    return hashlib.sha256("\n".join(coasterNames).encode("utf-8")).hexdigest()
+
+
+
+# ==================================================
+#  pack/unpack a list of ballots as flat arrays
+# ==================================================
+
+def packBallots(ballots):
+    info = [[b.filename, b.voterInfo, b.creditNum, b.messages, b.error,
+             b.path, b.size, b.mtime, b.contentHash] for b in ballots]
+    lengths = [len(b.indices) for b in ballots]
+    offsets = np.zeros(len(ballots) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    if ballots:
+        indices = np.concatenate([b.indices for b in ballots]).astype(np.int32)
+        ranks = np.concatenate([b.ranks for b in ballots]).astype(np.int32)
+    else:
+        indices = np.zeros(0, dtype=np.int32)
+        ranks = np.zeros(0, dtype=np.int32)
+    return info, offsets, indices, ranks
+
+def unpackBallots(info, offsets, indices, ranks):
+    ballots = []
+    for i, (filename, voterInfo, creditNum, messages, error, path, size, mtime, contentHash) in enumerate(info):
+        ballot = Ballot(filename)
+        ballot.voterInfo = voterInfo
+        ballot.creditNum = creditNum
+        ballot.messages = messages
+        ballot.error = error
+        ballot.path = path
+        ballot.size = size
+        ballot.mtime = mtime
+        ballot.contentHash = contentHash
+        ballot.indices = indices[offsets[i]:offsets[i+1]].astype(np.intp)
+        ballot.ranks = ranks[offsets[i]:offsets[i+1]]
+        ballots.append(ballot)
+    return ballots
+
+
+
+# ==================================================
+#  write/read a tally file
+#
+#  extra is an optional dict of JSON-friendly values
+#    stored alongside the tallies
+# ==================================================
+
+def saveTally(path, winLossMatrix, ballots, extra=None):
+    info, offsets, indices, ranks = packBallots(ballots)
+    pairKeys, wins, losses, ties = winLossMatrix.pairTallies()
+    header = {
+        "version": tallyFileVersion,
+        "coasters": winLossMatrix.names,
+        "coasterHash": coasterListHash(winLossMatrix.names),
+        "pairs": winLossMatrix.pairs,
+        "ballots": info,
+        "extra": extra or {},
+    }
+    with open(path, "wb") as f:
+        np.savez_compressed(f, header=np.array(json.dumps(header)),
+                            riders=winLossMatrix.riders, totalWins=winLossMatrix.totalWins,
+                            totalLosses=winLossMatrix.totalLosses, totalTies=winLossMatrix.totalTies,
+                            pairKeys=pairKeys, wins=wins, losses=losses, ties=ties,
+                            offsets=offsets, indices=indices, ranks=ranks)
+
+def loadTally(path):
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data["header"]))
+        if header["version"] != tallyFileVersion:
+            raise ValueError("{0} is tally file version {1}; expected {2}".format(
+                path, header["version"], tallyFileVersion))
+        if header["coasterHash"] != coasterListHash(header["coasters"]):
+            raise ValueError("{0} has a corrupt coaster list".format(path))
+
+        winLossMatrix = WinLossMatrix(header["coasters"], header["pairs"])
+        for key in ("riders", "totalWins", "totalLosses", "totalTies"):
+            getattr(winLossMatrix, key)[:] = data[key]
+        winLossMatrix.addPending(data["pairKeys"], data["wins"], data["losses"], data["ties"])
+
+        ballots = unpackBallots(header["ballots"], data["offsets"], data["indices"], data["ranks"])
+    return winLossMatrix, ballots, header